@@ -1,4 +1,5 @@
 import React, { useState, useMemo } from "react";
+import axios from "axios";
 import {
   BrowserRouter as Router,
   Switch,
@@ -23,6 +24,10 @@ const App = () => {
     if (storedAuth === "true") {
       setIsAuthenticated(true);
     }
+    const token = localStorage.getItem("authToken");
+    if (token) {
+      axios.defaults.headers.common["Authorization"] = `Bearer ${token}`;
+    }
   }, []);
 
   return (
@@ -1,15 +1,44 @@
 import React, { useEffect, useRef, useState } from "react";
 import Webcam from "react-webcam";
-import axios from "axios";
 
-const API_URL = "https://smart-inventory-management-k5rx.onrender.com/detect";
+const WS_URL = "wss://smart-inventory-management-k5rx.onrender.com/ws/detect";
 
 const ObjectDetection = ({ itemName, onDetect, onCancel }) => {
   const webcamRef = useRef(null);
+  const socketRef = useRef(null);
   const [devices, setDevices] = useState([]);
   const [selectedCamera, setSelectedCamera] = useState("");
   const [noDetectionTimeout, setNoDetectionTimeout] = useState(null);
 
+  useEffect(() => {
+    const socket = new WebSocket(WS_URL);
+    socket.onopen = () => {
+      socket.send(JSON.stringify({ itemName }));
+    };
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.error) {
+        console.error("Detection failed", data.error);
+        return;
+      }
+      console.log("Detections:", data.detections);
+
+      if (data.found) {
+        console.log("✅ Object detected! Closing camera...");
+        onDetect(true);
+      }
+    };
+    socket.onerror = (error) => {
+      console.error("Detection socket error", error);
+    };
+    socketRef.current = socket;
+
+    return () => {
+      socket.close();
+      socketRef.current = null;
+    };
+  }, [itemName]);
+
   useEffect(() => {
     navigator.mediaDevices.enumerateDevices().then((deviceList) => {
       const videoDevices = deviceList.filter(
@@ -55,28 +84,21 @@ const ObjectDetection = ({ itemName, onDetect, onCancel }) => {
           canvas.height = 700;
           const ctx = canvas.getContext("2d");
           ctx.drawImage(image, 0, 0, 700, 700);
-          const base64Image = canvas.toDataURL("image/jpeg").split(",")[1];
-
-          axios
-            .post(API_URL, { image_base64: base64Image })
-            .then((response) => {
-              const detections = response.data?.detections || [];
-              console.log("Detections:", detections);
-
-              const found = detections.some(
-                (d) =>
-                  d.label.toLowerCase() === itemName.toLowerCase() &&
-                  d.confidence > 0.6
-              );
-
-              if (found) {
-                console.log("✅ Object detected! Closing camera...");
-                onDetect(true);
-              }
-            })
-            .catch((error) => {
-              console.error("Detection failed", error);
-            });
+
+          // Skip this frame if the previous one is still being sent
+          const socket = socketRef.current;
+          if (
+            !socket ||
+            socket.readyState !== WebSocket.OPEN ||
+            socket.bufferedAmount > 0
+          ) {
+            return;
+          }
+          canvas.toBlob((blob) => {
+            if (blob && socket.readyState === WebSocket.OPEN) {
+              socket.send(blob);
+            }
+          }, "image/jpeg");
         };
       }
     }, 1500);
@@ -24,6 +24,10 @@ const Login = ({ setIsAuthenticated }) => {
       if (response.status === 200) {
         setIsAuthenticated(true);
         localStorage.setItem("isAuthenticated", "true");
+        localStorage.setItem("authToken", response.data.token);
+        axios.defaults.headers.common[
+          "Authorization"
+        ] = `Bearer ${response.data.token}`;
         history.push("/admin");
       }
     } catch (error) {
@@ -0,0 +1,113 @@
+from collections import Counter, defaultdict
+
+import torch
+from torchvision.ops import box_iou
+
+from shards import to_float_images
+
+# COCO-style detection metrics: AP per class averaged over IoU thresholds
+# 0.50:0.05:0.95, each AP sampled at 101 recall points from the
+# interpolated precision-recall curve.
+
+IOU_THRESHOLDS = torch.linspace(0.5, 0.95, 10)
+RECALL_POINTS = torch.linspace(0, 1, 101)
+
+
+def match_detections(pred_boxes, pred_scores, gt_boxes, iou_thresholds=IOU_THRESHOLDS):
+    # Greedy COCO matching of one image's detections of one class: in
+    # descending score order each detection takes the best still-unmatched
+    # ground truth box. All thresholds are matched at once, so the loop only
+    # runs over this image's detections of the class. Returns (T, N) true
+    # positive flags and the sorted scores.
+    scores, order = pred_scores.sort(descending=True)
+    tp = torch.zeros(len(iou_thresholds), len(scores), dtype=torch.bool)
+    if len(scores) == 0 or len(gt_boxes) == 0:
+        return tp, scores
+
+    ious = box_iou(pred_boxes[order], gt_boxes)
+    matched = torch.zeros(len(iou_thresholds), len(gt_boxes), dtype=torch.bool)
+    for i in range(len(scores)):
+        best_iou, best_gt = ious[i].expand_as(matched).masked_fill(matched, -1).max(dim=1)
+        hit = best_iou >= iou_thresholds
+        tp[:, i] = hit
+        matched[hit, best_gt[hit]] = True
+    return tp, scores
+
+
+def average_precision(tp, scores, num_gt):
+    # AP per IoU threshold from (T, N) true positive flags pooled over images
+    if num_gt == 0:
+        return None
+    if tp.shape[1] == 0:
+        return torch.zeros(tp.shape[0])
+    tp = tp[:, scores.argsort(descending=True, stable=True)]
+    true_positives = tp.cumsum(dim=1, dtype=torch.float32)
+    recall = true_positives / num_gt
+    precision = true_positives / torch.arange(1, tp.shape[1] + 1)
+    # Interpolate: precision at recall r is the best precision at any recall >= r
+    precision = precision.flip(1).cummax(dim=1).values.flip(1)
+
+    points = RECALL_POINTS.expand(tp.shape[0], -1).contiguous()
+    index = torch.searchsorted(recall, points)
+    sampled = precision.gather(1, index.clamp(max=tp.shape[1] - 1))
+    sampled[index >= tp.shape[1]] = 0
+    return sampled.mean(dim=1)
+
+
+class DetectionEvaluator:
+    # Accumulates matches batch by batch; compute() pools them per class.
+    # Label 0 is background and is ignored.
+
+    def __init__(self, iou_thresholds=IOU_THRESHOLDS):
+        self.iou_thresholds = iou_thresholds
+        self._tp = defaultdict(list)
+        self._scores = defaultdict(list)
+        self._num_gt = Counter()
+
+    def update(self, predictions, targets):
+        for pred, target in zip(predictions, targets):
+            pred = {k: v.cpu() for k, v in pred.items()}
+            target = {k: v.cpu() for k, v in target.items()}
+            for label in torch.cat([pred["labels"], target["labels"]]).unique().tolist():
+                if label == 0:
+                    continue
+                pred_mask = pred["labels"] == label
+                gt_boxes = target["boxes"][target["labels"] == label]
+                tp, scores = match_detections(
+                    pred["boxes"][pred_mask], pred["scores"][pred_mask], gt_boxes, self.iou_thresholds
+                )
+                self._tp[label].append(tp)
+                self._scores[label].append(scores)
+                self._num_gt[label] += len(gt_boxes)
+
+    def compute(self):
+        per_class = {}
+        for label in sorted(self._tp):
+            ap = average_precision(
+                torch.cat(self._tp[label], dim=1), torch.cat(self._scores[label]), self._num_gt[label]
+            )
+            if ap is not None:
+                per_class[label] = ap
+        if not per_class:
+            return {"map": 0.0, "map_50": 0.0, "map_75": 0.0, "per_class": {}}
+
+        ap = torch.stack(list(per_class.values()))
+        iou_50 = int(torch.isclose(self.iou_thresholds, torch.tensor(0.5)).nonzero())
+        iou_75 = int(torch.isclose(self.iou_thresholds, torch.tensor(0.75)).nonzero())
+        return {
+            "map": ap.mean().item(),
+            "map_50": ap[:, iou_50].mean().item(),
+            "map_75": ap[:, iou_75].mean().item(),
+            "per_class": {label: v.mean().item() for label, v in per_class.items()},
+        }
+
+
+@torch.no_grad()
+def evaluate(model, data_loader, device):
+    # Batched inference over a whole split, one forward pass per batch
+    model.eval()
+    evaluator = DetectionEvaluator()
+    for images, targets in data_loader:
+        predictions = model(list(to_float_images(images, device)))
+        evaluator.update(predictions, targets)
+    return evaluator.compute()
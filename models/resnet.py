@@ -1,102 +1,35 @@
+import argparse
 import os
 import torch
-import torchvision.transforms as transforms
-from torch.utils.data import Dataset, DataLoader
 from torchvision.models import resnet50, ResNet50_Weights
-from PIL import Image
 import torch.nn as nn
 import torch.optim as optim
 import torchmetrics
-
-# Dataset Class
-class CustomDataset(Dataset):
-    def __init__(self, root_dir, transform=None):
-        self.root_dir = root_dir
-        self.transform = transform
-        self.image_paths = []
-        self.class_to_idx = {}
-
-        for idx, class_name in enumerate(os.listdir(root_dir)):
-            class_path = os.path.join(root_dir, class_name)
-            if os.path.isdir(class_path):
-                self.class_to_idx[class_name] = idx
-                for img_file in os.listdir(class_path):
-                    if img_file.endswith((".png", ".jpg", ".jpeg")):
-                        self.image_paths.append((os.path.join(class_path, img_file), class_name))
-
-    def __len__(self):
-        return len(self.image_paths)
-
-    def __getitem__(self, idx):
-        img_path, label_name = self.image_paths[idx]
-        image = Image.open(img_path).convert("RGB")
-
-        if label_name not in self.class_to_idx:
-            raise ValueError(f"Unknown class label: {label_name}")
-
-        label = self.class_to_idx[label_name]
-
-        if self.transform:
-            image = self.transform(image)
-
-        return image, label
-
-# Transformations
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-])
-
-# Load dataset
-dataset_path = "data"
-train_dataset = CustomDataset(dataset_path, transform=transform)
-train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True)
-
-# Define Model
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V1)
-model.fc = nn.Linear(model.fc.in_features, len(train_dataset.class_to_idx))
-model.to(device)
-
-# Loss & Optimizer
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=0.001)  # Lower learning rate
-
-# Initialize metrics
-accuracy_metric = torchmetrics.Accuracy(task="multiclass", num_classes=len(train_dataset.class_to_idx)).to(device)
-precision_metric = torchmetrics.Precision(task="multiclass", num_classes=len(train_dataset.class_to_idx)).to(device)
-recall_metric = torchmetrics.Recall(task="multiclass", num_classes=len(train_dataset.class_to_idx)).to(device)
-f1_metric = torchmetrics.F1Score(task="multiclass", num_classes=len(train_dataset.class_to_idx)).to(device)
+from shards import ShardedClassificationDataset, build_classification_shards, make_loader
+from trainer import Trainer, add_trainer_args, trainer_options
 
 # Training Function
-def train_one_epoch(model, optimizer, data_loader, device, epoch):
-    model.train()
-    running_loss = 0.0
-    accuracy_metric.reset()
-    precision_metric.reset()
-    recall_metric.reset()
-    f1_metric.reset()
-
-    for images, labels in data_loader:
-        images, labels = images.to(device), labels.to(device)
-
-        optimizer.zero_grad()
+def train_one_epoch(trainer, criterion, data_loader, epoch, metrics):
+    accuracy_metric, precision_metric, recall_metric, f1_metric = metrics
+    for metric in metrics:
+        metric.reset()
+
+    def step(model, batch):
+        images, labels = batch
+        images, labels = trainer.images(images), labels.to(trainer.device, non_blocking=True)
         outputs = model(images)
         loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
-
-        running_loss += loss.item()
 
         # Compute metrics
         preds = torch.argmax(outputs, dim=1)
-        accuracy_metric.update(preds, labels)
-        precision_metric.update(preds, labels)
-        recall_metric.update(preds, labels)
-        f1_metric.update(preds, labels)
+        for metric in metrics:
+            metric.update(preds, labels)
+        return loss, len(labels)
+
+    stats = trainer.train_epoch(data_loader, epoch, step)
 
     # Print metrics
-    epoch_loss = running_loss / len(data_loader)
+    epoch_loss = stats["loss"]
     epoch_acc = accuracy_metric.compute().item()
     epoch_prec = precision_metric.compute().item()
     epoch_recall = recall_metric.compute().item()
@@ -108,23 +41,59 @@ def train_one_epoch(model, optimizer, data_loader, device, epoch):
 
 # Main Training Loop
 def main():
-    num_epochs = 2
-    all_losses, all_acc, all_prec, all_recall, all_f1 = [], [], [], [], []
-
-    for epoch in range(num_epochs):
-        loss, acc, prec, recall, f1 = train_one_epoch(model, optimizer, train_loader, device, epoch)
-        all_losses.append(loss)
-        all_acc.append(acc)
-        all_prec.append(prec)
-        all_recall.append(recall)
-        all_f1.append(f1)
+    parser = argparse.ArgumentParser(description="Fine-tune ResNet-50 on class-folder images")
+    add_trainer_args(parser, epochs=2, batch_size=8, checkpoint_dir="checkpoints/resnet")
+    args = parser.parse_args()
+
+    # Load dataset. Images are packed into memory-mapped shards on the first
+    # run (or with `python shards.py classification data shards/resnet`);
+    # delete the shard directory after changing the data. Setup lives here
+    # rather than at module level so loader workers don't repeat it on import.
+    dataset_path = "data"
+    shard_path = "shards/resnet"
+    if not os.path.exists(os.path.join(shard_path, "meta.json")):
+        build_classification_shards(dataset_path, shard_path, size=(224, 224))
+    train_dataset = ShardedClassificationDataset(shard_path)
+    train_loader = make_loader(train_dataset, batch_size=args.batch_size)
+    num_classes = len(train_dataset.class_to_idx)
+
+    # Define Model
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V1)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+
+    # Loss & Optimizer
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=0.001)  # Lower learning rate
+    trainer = Trainer(model, optimizer, device, **trainer_options(args))
+
+    # Initialize metrics
+    metrics = (
+        torchmetrics.Accuracy(task="multiclass", num_classes=num_classes).to(device),
+        torchmetrics.Precision(task="multiclass", num_classes=num_classes).to(device),
+        torchmetrics.Recall(task="multiclass", num_classes=num_classes).to(device),
+        torchmetrics.F1Score(task="multiclass", num_classes=num_classes).to(device),
+    )
+
+    history = {"loss": [], "acc": [], "prec": [], "recall": [], "f1": []}
+    start_epoch = 0
+    if args.resume:
+        start_epoch, state = trainer.resume(args.resume)
+        history = state["history"]
+
+    for epoch in range(start_epoch, args.epochs):
+        results = train_one_epoch(trainer, criterion, train_loader, epoch, metrics)
+        for values, value in zip(history.values(), results):
+            values.append(value)
+        best = history["acc"][-1] == max(history["acc"])
+        trainer.checkpoint(epoch, {"history": history}, best=best)
 
     # Final metrics summary
     print("\n=== Final Model Metrics ===")
-    print(f"Final mAP (approximate based on accuracy): {max(all_acc) * 100:.2f}%")
-    print(f"Final Precision: {max(all_prec) * 100:.2f}%")
-    print(f"Final Recall: {max(all_recall) * 100:.2f}%")
-    print(f"Final F1 Score: {max(all_f1) * 100:.2f}%")
+    print(f"Final mAP (approximate based on accuracy): {max(history['acc']) * 100:.2f}%")
+    print(f"Final Precision: {max(history['prec']) * 100:.2f}%")
+    print(f"Final Recall: {max(history['recall']) * 100:.2f}%")
+    print(f"Final F1 Score: {max(history['f1']) * 100:.2f}%")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+# Packs a dataset into memory-mapped shards once, so training never parses
+# XML or decodes JPEGs again:
+#
+#   meta.json               task, image size, class_to_idx, shard size and list
+#   images-00000.npy ...    uint8 (count, H, W, 3), already resized
+#   boxes.npy / labels.npy / offsets.npy   detection: normalized boxes and
+#                           labels of image i are rows offsets[i]:offsets[i+1]
+#                           (datasets return them in pixels of the packed image)
+#   labels.npy              classification: one label per image
+#
+# Datasets map the shards copy-on-write, so reading a sample is a view into
+# the page cache shared by every loader worker, not a decode.
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+SHARD_SIZE = 1024
+
+
+def load_image(path, size):
+    # Same result as transforms.Resize((h, w)) on a PIL image
+    height, width = size
+    with Image.open(path) as image:
+        image = image.convert("RGB").resize((width, height), Image.BILINEAR)
+        return np.asarray(image, dtype=np.uint8)
+
+
+def parse_voc(xml_path):
+    # Returns ([(class_name, xmin, ymin, xmax, ymax), ...] normalized, invalid box count)
+    root = ET.parse(xml_path).getroot()
+    size = root.find("size")
+    img_width = int(size.find("width").text)
+    img_height = int(size.find("height").text)
+
+    objects = []
+    invalid = 0
+    for obj in root.findall("object"):
+        bbox = obj.find("bndbox")
+        xmin = float(bbox.find("xmin").text) / img_width
+        ymin = float(bbox.find("ymin").text) / img_height
+        xmax = float(bbox.find("xmax").text) / img_width
+        ymax = float(bbox.find("ymax").text) / img_height
+        if xmin >= xmax or ymin >= ymax:
+            invalid += 1
+            continue
+        objects.append((obj.find("name").text, xmin, ymin, xmax, ymax))
+    return objects, invalid
+
+
+def _ingest_image(job):
+    img_path, size = job
+    return load_image(img_path, size)
+
+
+def _write_shards(out_dir, images, count, size):
+    # Streams decoded images into fixed-size .npy shards without holding
+    # the dataset in memory
+    height, width = size
+    shards = []
+    shard = None
+    for i, image in enumerate(images):
+        offset = i % SHARD_SIZE
+        if offset == 0:
+            if shard is not None:
+                shard.flush()
+            name = f"images-{len(shards):05d}.npy"
+            rows = min(SHARD_SIZE, count - i)
+            shard = np.lib.format.open_memmap(
+                os.path.join(out_dir, name), mode="w+", dtype=np.uint8, shape=(rows, height, width, 3)
+            )
+            shards.append({"file": name, "count": rows})
+        shard[offset] = image
+    if shard is not None:
+        shard.flush()
+    return shards
+
+
+def _write_meta(out_dir, meta):
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def build_detection_shards(root_dir, out_dir, size=(300, 300), workers=None):
+    # Pascal VOC layout: image.jpg next to image.xml. Images without a valid
+    # box are skipped. Files are ingested in sorted order so class ids are
+    # reproducible across runs and machines.
+    os.makedirs(out_dir, exist_ok=True)
+    img_paths, xml_paths = [], []
+    for img_file in sorted(os.listdir(root_dir)):
+        if img_file.lower().endswith(IMAGE_EXTENSIONS):
+            xml_path = os.path.join(root_dir, os.path.splitext(img_file)[0] + ".xml")
+            if os.path.exists(xml_path):
+                img_paths.append(os.path.join(root_dir, img_file))
+                xml_paths.append(xml_path)
+
+    class_to_idx = {"background": 0}
+    boxes, labels, offsets = [], [], [0]
+    invalid_boxes = 0
+    jobs = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Annotations first, so only images that are kept get decoded
+        for img_path, (objects, invalid) in zip(img_paths, pool.map(parse_voc, xml_paths, chunksize=64)):
+            invalid_boxes += invalid
+            if not objects:
+                continue
+            for class_name, *box in objects:
+                boxes.append(box)
+                labels.append(class_to_idx.setdefault(class_name, len(class_to_idx)))
+            offsets.append(len(boxes))
+            jobs.append((img_path, tuple(size)))
+
+        # Decoded images come back in order and go straight into their shard
+        shards = _write_shards(out_dir, pool.map(_ingest_image, jobs, chunksize=16), len(jobs), size)
+    count = len(jobs)
+
+    np.save(os.path.join(out_dir, "boxes.npy"), np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+    np.save(os.path.join(out_dir, "labels.npy"), np.asarray(labels, dtype=np.int64))
+    np.save(os.path.join(out_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    _write_meta(out_dir, {
+        "task": "detection",
+        "size": list(size),
+        "class_to_idx": class_to_idx,
+        "num_images": count,
+        "invalid_boxes": invalid_boxes,
+        "shard_size": SHARD_SIZE,
+        "shards": shards,
+    })
+    print(f"Packed {count} images ({len(boxes)} boxes, {invalid_boxes} invalid skipped) into {out_dir}")
+    print(f"Classes: {class_to_idx}")
+
+
+def build_classification_shards(root_dir, out_dir, size=(224, 224), workers=None):
+    # One sub-directory per class, named after the class
+    os.makedirs(out_dir, exist_ok=True)
+    class_names = sorted(d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d)))
+    class_to_idx = {name: idx for idx, name in enumerate(class_names)}
+    jobs, labels = [], []
+    for class_name in class_names:
+        class_path = os.path.join(root_dir, class_name)
+        for img_file in sorted(os.listdir(class_path)):
+            if img_file.lower().endswith(IMAGE_EXTENSIONS):
+                jobs.append((os.path.join(class_path, img_file), tuple(size)))
+                labels.append(class_to_idx[class_name])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shards = _write_shards(out_dir, pool.map(_ingest_image, jobs, chunksize=16), len(jobs), size)
+
+    np.save(os.path.join(out_dir, "labels.npy"), np.asarray(labels, dtype=np.int64))
+    _write_meta(out_dir, {
+        "task": "classification",
+        "size": list(size),
+        "class_to_idx": class_to_idx,
+        "num_images": len(jobs),
+        "shard_size": SHARD_SIZE,
+        "shards": shards,
+    })
+    print(f"Packed {len(jobs)} images in {len(class_to_idx)} classes into {out_dir}")
+
+
+class _ShardDataset(Dataset):
+    # Samples are uint8 CHW tensors; convert to float on the device with
+    # to_float_images() so the loader moves 4x fewer bytes. Shards are opened
+    # lazily, so each loader worker maps them itself instead of receiving
+    # pickled arrays.
+
+    def __init__(self, shard_dir, transform=None):
+        self.shard_dir = shard_dir
+        self.transform = transform
+        with open(os.path.join(shard_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.class_to_idx = self.meta["class_to_idx"]
+        self._shards = None
+
+    def _open(self):
+        # mmap_mode="c" (copy-on-write) gives writable arrays, so torch
+        # wraps them without copying or warning
+        self._shards = [
+            np.load(os.path.join(self.shard_dir, shard["file"]), mmap_mode="c")
+            for shard in self.meta["shards"]
+        ]
+
+    def _image(self, idx):
+        if self._shards is None:
+            self._open()
+        shard, row = divmod(idx, self.meta["shard_size"])
+        image = torch.from_numpy(self._shards[shard][row]).permute(2, 0, 1)
+        return self.transform(image) if self.transform else image
+
+    def __len__(self):
+        return self.meta["num_images"]
+
+
+class ShardedDetectionDataset(_ShardDataset):
+    # Targets are in pixels of the packed image, as torchvision detection
+    # models expect for training and return from inference
+
+    def __init__(self, shard_dir, transform=None):
+        super().__init__(shard_dir, transform)
+        height, width = self.meta["size"]
+        scale = np.array([width, height, width, height], dtype=np.float32)
+        self.boxes = np.load(os.path.join(shard_dir, "boxes.npy")) * scale
+        self.labels = np.load(os.path.join(shard_dir, "labels.npy"))
+        self.offsets = np.load(os.path.join(shard_dir, "offsets.npy"))
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        target = {
+            "boxes": torch.from_numpy(self.boxes[start:end].copy()),
+            "labels": torch.from_numpy(self.labels[start:end].copy()),
+        }
+        return self._image(idx), target
+
+
+class ShardedClassificationDataset(_ShardDataset):
+    def __init__(self, shard_dir, transform=None):
+        super().__init__(shard_dir, transform)
+        self.labels = np.load(os.path.join(shard_dir, "labels.npy"))
+
+    def __getitem__(self, idx):
+        return self._image(idx), int(self.labels[idx])
+
+
+def detection_collate(batch):
+    # Images share one size after packing, so they stack into one tensor
+    images, targets = zip(*batch)
+    return torch.stack(images), list(targets)
+
+
+def make_loader(dataset, batch_size, shuffle=True, collate_fn=None, workers=None):
+    if workers is None:
+        workers = min(8, os.cpu_count() or 1)
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        collate_fn=collate_fn,
+        num_workers=workers,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=workers > 0,
+        prefetch_factor=4 if workers > 0 else None,
+    )
+
+
+def to_float_images(images, device):
+    # uint8 batch -> float in [0, 1] on the device, like ToTensor()
+    return images.to(device, non_blocking=True).float().div_(255)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a dataset into memory-mapped training shards")
+    parser.add_argument("task", choices=["detection", "classification"])
+    parser.add_argument("root_dir")
+    parser.add_argument("out_dir")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--workers", type=int, help="Ingest processes (default: all CPUs)")
+    args = parser.parse_args()
+
+    if args.task == "detection":
+        build_detection_shards(args.root_dir, args.out_dir, args.size or (300, 300), args.workers)
+    else:
+        build_classification_shards(args.root_dir, args.out_dir, args.size or (224, 224), args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+import evaluate as evaluate_module
+from evaluate import DetectionEvaluator, average_precision, match_detections
+from shards import ShardedDetectionDataset, build_detection_shards, detection_collate, make_loader
+
+
+def boxes(*rows):
+    return torch.tensor(rows, dtype=torch.float32).reshape(-1, 4)
+
+
+def prediction(box_rows, scores, labels):
+    return {"boxes": boxes(*box_rows), "scores": torch.tensor(scores), "labels": torch.tensor(labels)}
+
+
+def target(box_rows, labels):
+    return {"boxes": boxes(*box_rows), "labels": torch.tensor(labels)}
+
+
+def evaluate(predictions, targets):
+    evaluator = DetectionEvaluator()
+    evaluator.update(predictions, targets)
+    return evaluator.compute()
+
+
+def test_perfect_detections_score_one():
+    results = evaluate(
+        [prediction([[0, 0, 10, 10], [20, 20, 40, 40]], [0.9, 0.8], [1, 2])],
+        [target([[0, 0, 10, 10], [20, 20, 40, 40]], [1, 2])],
+    )
+    assert results["map"] == pytest.approx(1.0)
+    assert results["per_class"] == {1: pytest.approx(1.0), 2: pytest.approx(1.0)}
+
+
+def test_loose_box_only_counts_at_low_iou_thresholds():
+    # IoU 0.7: a hit at 0.50, 0.55, 0.60, 0.65 and 0.70, a miss above
+    results = evaluate([prediction([[0, 0, 10, 7]], [0.9], [1])], [target([[0, 0, 10, 10]], [1])])
+    assert results["map"] == pytest.approx(0.5)
+    assert results["map_50"] == pytest.approx(1.0)
+    assert results["map_75"] == pytest.approx(0.0)
+
+
+def test_precision_is_interpolated_over_101_recall_points():
+    # TP, FP, TP over two ground truths: precision 1 up to recall 0.5, then 2/3
+    tp = torch.tensor([[True, False, True]])
+    ap = average_precision(tp, torch.tensor([0.9, 0.8, 0.7]), num_gt=2)
+    assert ap.item() == pytest.approx((51 * 1 + 50 * 2 / 3) / 101)
+
+
+def test_each_ground_truth_matches_once():
+    # The duplicate is a false positive even though it overlaps perfectly
+    tp, scores = match_detections(boxes([0, 0, 10, 10], [0, 0, 10, 10]), torch.tensor([0.8, 0.9]), boxes([0, 0, 10, 10]))
+    assert scores.tolist() == pytest.approx([0.9, 0.8])
+    assert tp.all(dim=0).tolist() == [True, False]
+
+
+def test_higher_scored_false_positive_halves_precision():
+    results = evaluate(
+        [prediction([[50, 50, 60, 60], [0, 0, 10, 10]], [0.9, 0.8], [1, 1])],
+        [target([[0, 0, 10, 10]], [1])],
+    )
+    assert results["map"] == pytest.approx(0.5)
+
+
+def test_classes_without_ground_truth_and_background_are_ignored():
+    results = evaluate(
+        [prediction([[0, 0, 10, 10], [0, 0, 5, 5], [0, 0, 5, 5]], [0.9, 0.9, 0.9], [1, 2, 0])],
+        [target([[0, 0, 10, 10], [30, 30, 40, 40]], [1, 3])],
+    )
+    # Class 2 has no ground truth; class 3 was never detected
+    assert results["per_class"] == {1: pytest.approx(1.0), 3: pytest.approx(0.0)}
+    assert results["map"] == pytest.approx(0.5)
+
+
+def test_no_ground_truth_at_all():
+    results = evaluate([prediction([[0, 0, 10, 10]], [0.9], [1])], [target([], [])])
+    assert results == {"map": 0.0, "map_50": 0.0, "map_75": 0.0, "per_class": {}}
+
+
+def test_matches_pycocotools_on_random_detections():
+    pytest.importorskip("pycocotools")
+    from pycocotools.coco import COCO
+    from pycocotools.cocoeval import COCOeval
+
+    generator = torch.Generator().manual_seed(0)
+
+    def random_boxes(count):
+        corners = torch.rand(count, 2, generator=generator) * 200
+        sizes = torch.rand(count, 2, generator=generator) * 80 + 40
+        return torch.cat([corners, corners + sizes], dim=1)
+
+    predictions, targets = [], []
+    for _ in range(8):
+        gt = random_boxes(5)
+        labels = torch.randint(1, 4, (5,), generator=generator)
+        # Jittered copies of the ground truth plus unrelated boxes
+        pred_boxes = torch.cat([gt + torch.randn(gt.shape, generator=generator) * 6, random_boxes(4)])
+        targets.append({"boxes": gt, "labels": labels})
+        predictions.append({
+            "boxes": pred_boxes,
+            "scores": torch.rand(len(pred_boxes), generator=generator),
+            "labels": torch.cat([labels, torch.randint(1, 4, (4,), generator=generator)]),
+        })
+
+    def xywh(box):
+        return [box[0], box[1], box[2] - box[0], box[3] - box[1]]
+
+    annotations, detections = [], []
+    for image_id, (pred, target) in enumerate(zip(predictions, targets)):
+        for box, label in zip(target["boxes"].tolist(), target["labels"].tolist()):
+            bbox = xywh(box)
+            annotations.append({
+                "id": len(annotations) + 1, "image_id": image_id, "category_id": label,
+                "bbox": bbox, "area": bbox[2] * bbox[3], "iscrowd": 0,
+            })
+        for box, label, score in zip(pred["boxes"].tolist(), pred["labels"].tolist(), pred["scores"].tolist()):
+            detections.append({"image_id": image_id, "category_id": label, "bbox": xywh(box), "score": score})
+    coco = COCO()
+    coco.dataset = {
+        "images": [{"id": image_id} for image_id in range(len(targets))],
+        "categories": [{"id": label} for label in (1, 2, 3)],
+        "annotations": annotations,
+    }
+    coco.createIndex()
+    reference = COCOeval(coco, coco.loadRes(detections), "bbox")
+    reference.evaluate()
+    reference.accumulate()
+    reference.summarize()
+
+    results = evaluate(predictions, targets)
+    assert results["map"] == pytest.approx(reference.stats[0], abs=1e-4)
+    assert results["map_50"] == pytest.approx(reference.stats[1], abs=1e-4)
+    assert results["map_75"] == pytest.approx(reference.stats[2], abs=1e-4)
+
+
+VOC_ANNOTATION = """<annotation>
+  <size><width>600</width><height>400</height><depth>3</depth></size>
+  <object><name>chair</name><bndbox><xmin>60</xmin><ymin>100</ymin><xmax>300</xmax><ymax>300</ymax></bndbox></object>
+</annotation>"""
+
+
+class FixedDetector(torch.nn.Module):
+    # Predicts the annotated chair in pixels of the 300x300 input, as a
+    # torchvision detection model would
+    def forward(self, images):
+        return [prediction([[30, 75, 150, 225]], [0.9], [1]) for _ in images]
+
+
+def test_dataset_samples_evaluate_in_pixel_coordinates(tmp_path):
+    Image.fromarray(np.zeros((400, 600, 3), dtype=np.uint8)).save(tmp_path / "room.jpg")
+    (tmp_path / "room.xml").write_text(VOC_ANNOTATION)
+    build_detection_shards(tmp_path, tmp_path / "shards", size=(300, 300), workers=1)
+    dataset = ShardedDetectionDataset(tmp_path / "shards")
+
+    image, target = dataset[0]
+    assert image.shape == (3, 300, 300)
+    assert target["boxes"].tolist() == [[30, 75, 150, 225]]
+
+    loader = make_loader(dataset, batch_size=1, shuffle=False, collate_fn=detection_collate, workers=0)
+    results = evaluate_module.evaluate(FixedDetector(), loader, "cpu")
+    assert results["map"] == pytest.approx(1.0)
@@ -0,0 +1,159 @@
+import os
+import time
+
+import torch
+
+from shards import to_float_images
+
+# Training loop shared by ssd.py and resnet.py. The scripts supply a step
+# function that computes the loss for one batch; the trainer owns the
+# precision, memory format, compilation, gradient accumulation,
+# checkpointing and throughput logging around it.
+
+
+def add_trainer_args(parser, epochs, batch_size, checkpoint_dir):
+    parser.add_argument("--epochs", type=int, default=epochs)
+    parser.add_argument("--batch-size", type=int, default=batch_size)
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast (CPU or GPU)")
+    parser.add_argument("--channels-last", action="store_true", help="NHWC memory format for convolutions")
+    parser.add_argument("--compile", action="store_true", help="Run the training forward pass through torch.compile")
+    parser.add_argument("--accum-steps", type=int, default=1, help="Batches per optimizer step")
+    parser.add_argument("--checkpoint-dir", default=checkpoint_dir)
+    parser.add_argument("--checkpoint-every", type=int, default=1, help="Epochs between checkpoints")
+    parser.add_argument("--resume", help="Checkpoint to resume from, e.g. <checkpoint-dir>/last.pt")
+    parser.add_argument("--log-every", type=int, default=10, help="Optimizer steps between throughput logs")
+
+
+def trainer_options(args):
+    return {
+        "bf16": args.bf16,
+        "channels_last": args.channels_last,
+        "compile": args.compile,
+        "accum_steps": args.accum_steps,
+        "checkpoint_dir": args.checkpoint_dir,
+        "checkpoint_every": args.checkpoint_every,
+        "log_every": args.log_every,
+    }
+
+
+class Trainer:
+    def __init__(self, model, optimizer, device, bf16=False, channels_last=False, compile=False,
+                 accum_steps=1, checkpoint_dir="checkpoints", checkpoint_every=1, log_every=10):
+        self.device = torch.device(device)
+        self.model = model.to(self.device)
+        self.optimizer = optimizer
+        self.bf16 = bf16
+        self.channels_last = channels_last
+        self.accum_steps = max(1, accum_steps)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self.log_every = log_every
+        self.global_step = 0
+        if channels_last:
+            self.model.to(memory_format=torch.channels_last)
+        # Checkpoints and evaluation use self.model; only the training
+        # forward pass goes through the compiled wrapper, which shares its
+        # parameters
+        self.forward_model = torch.compile(self.model) if compile else self.model
+
+    def images(self, images):
+        # uint8 loader batch -> float images on the device, in the trainer's memory format
+        images = to_float_images(images, self.device)
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        return images
+
+    def autocast(self):
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=self.bf16)
+
+    def _optimizer_step(self):
+        self.optimizer.step()
+        self.optimizer.zero_grad(set_to_none=True)
+        self.global_step += 1
+
+    def train_epoch(self, data_loader, epoch, step_fn):
+        # step_fn(model, batch) returns (loss, number of images), or None to
+        # skip the batch. Losses are divided by accum_steps so accumulated
+        # gradients match one large batch.
+        self.model.train()
+        self.optimizer.zero_grad(set_to_none=True)
+        total_loss = torch.zeros((), device=self.device)
+        total_images = 0
+        batches = 0
+        pending = 0
+        log_start = epoch_start = time.perf_counter()
+        log_images = 0
+        data_time = 0.0
+
+        fetch_start = time.perf_counter()
+        for batch in data_loader:
+            data_time += time.perf_counter() - fetch_start
+            with self.autocast():
+                result = step_fn(self.forward_model, batch)
+            if result is not None:
+                loss, num_images = result
+                (loss / self.accum_steps).backward()
+                total_loss += loss.detach()
+                total_images += num_images
+                log_images += num_images
+                batches += 1
+                pending += 1
+                if pending == self.accum_steps:
+                    self._optimizer_step()
+                    pending = 0
+                    if self.global_step % self.log_every == 0:
+                        # .item() synchronizes, so the interval timing is accurate
+                        elapsed = time.perf_counter() - log_start
+                        print(f"Epoch [{epoch+1}] Step [{self.global_step}] "
+                              f"Loss: {total_loss.item() / batches:.4f}, "
+                              f"{elapsed / self.log_every * 1000:.0f} ms/step "
+                              f"({data_time / self.log_every * 1000:.0f} ms data), "
+                              f"{log_images / elapsed:.1f} img/s")
+                        log_start = time.perf_counter()
+                        log_images = 0
+                        data_time = 0.0
+            fetch_start = time.perf_counter()
+
+        if pending:
+            self._optimizer_step()
+        elapsed = time.perf_counter() - epoch_start
+        stats = {
+            "loss": total_loss.item() / max(1, batches),
+            "images_per_sec": total_images / elapsed,
+            "seconds": elapsed,
+        }
+        print(f"Epoch [{epoch+1}]: Loss: {stats['loss']:.4f}, "
+              f"{stats['images_per_sec']:.1f} img/s, {stats['seconds']:.1f}s")
+        return stats
+
+    def checkpoint(self, epoch, state=None, best=False):
+        # Writes last.pt every checkpoint_every epochs (and whenever best is
+        # set), and the model weights alone to best.pt when best is True.
+        # Files are replaced atomically so an interrupted save never
+        # corrupts the checkpoint to resume from.
+        if not best and (epoch + 1) % self.checkpoint_every:
+            return
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self._save(os.path.join(self.checkpoint_dir, "last.pt"), {
+            "epoch": epoch,
+            "global_step": self.global_step,
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "state": state or {},
+        })
+        if best:
+            self._save(os.path.join(self.checkpoint_dir, "best.pt"), self.model.state_dict())
+
+    def _save(self, path, obj):
+        tmp_path = path + ".tmp"
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+
+    def resume(self, path):
+        # Returns (first epoch to run, the state passed to checkpoint())
+        checkpoint = torch.load(path, map_location=self.device)
+        self.model.load_state_dict(checkpoint["model"])
+        self.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.global_step = checkpoint["global_step"]
+        print(f"Resumed from {path} after epoch {checkpoint['epoch'] + 1}")
+        return checkpoint["epoch"] + 1, checkpoint["state"]
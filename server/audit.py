@@ -0,0 +1,116 @@
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+
+from metrics import Gauge
+
+active_audits_gauge = Gauge(
+    "audit_sessions_active",
+    "Room audits started and not yet finished or expired",
+)
+
+
+class AuditSession:
+    # Matches every frame's detections against a room's whole expected
+    # inventory. Items are matched by name (the detector's class label,
+    # case-insensitive). When a room holds several items with the same name,
+    # the largest number of that label seen in any single frame marks that
+    # many of them found; counts are not summed across frames, because the
+    # same chair seen twice is still one chair.
+
+    def __init__(self, room_id, inventory, confidence=0.75):
+        self.id = uuid.uuid4().hex
+        self.room_id = room_id
+        self.inventory = inventory
+        self.confidence = confidence
+        self.started = time.time()
+        self.frames = 0
+        self._items_by_name = defaultdict(list)
+        for item in inventory:
+            self._items_by_name[item["name"].lower()].append(item)
+        self._seen = Counter()
+
+    @property
+    def labels(self):
+        return list(self._items_by_name)
+
+    def observe(self, detections):
+        # Returns True when this frame found something new
+        self.frames += 1
+        counts = Counter(d["label"].lower() for d in detections if d["label"].lower() in self._items_by_name)
+        changed = False
+        for label, count in counts.items():
+            count = min(count, len(self._items_by_name[label]))
+            if count > self._seen[label]:
+                self._seen[label] = count
+                changed = True
+        return changed
+
+    def found_items(self):
+        return [
+            item
+            for label, items in self._items_by_name.items()
+            for item in items[:self._seen[label]]
+        ]
+
+    def missing_items(self):
+        return [
+            item
+            for label, items in self._items_by_name.items()
+            for item in items[self._seen[label]:]
+        ]
+
+    @property
+    def complete(self):
+        return all(self._seen[label] >= len(items) for label, items in self._items_by_name.items())
+
+    def summary(self):
+        return {
+            "auditId": self.id,
+            "roomId": self.room_id,
+            "frames": self.frames,
+            "found": self.found_items(),
+            "missing": self.missing_items(),
+            "complete": self.complete,
+        }
+
+
+class AuditSessions:
+    # In-process registry of running audits. Sessions idle for longer than
+    # ttl are dropped, and the oldest is dropped beyond max_sessions. With
+    # several server processes, an audit's requests must reach the process
+    # that started it.
+
+    def __init__(self, ttl=1800.0, max_sessions=256):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            audit_id, (session, last_used) = next(iter(self._sessions.items()))
+            if last_used > now - self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[audit_id]
+        active_audits_gauge.set(len(self._sessions))
+
+    def start(self, room_id, inventory, confidence=0.75):
+        session = AuditSession(room_id, inventory, confidence)
+        self._sessions[session.id] = (session, time.monotonic())
+        self._expire()
+        return session
+
+    def get(self, audit_id):
+        self._expire()
+        entry = self._sessions.get(audit_id)
+        if entry is None:
+            return None
+        self._sessions[audit_id] = (entry[0], time.monotonic())
+        self._sessions.move_to_end(audit_id)
+        return entry[0]
+
+    def finish(self, audit_id):
+        entry = self._sessions.pop(audit_id, None)
+        active_audits_gauge.set(len(self._sessions))
+        return entry and entry[0]
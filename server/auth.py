@@ -0,0 +1,96 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+# bcrypt only looks at the first 72 bytes and refuses longer input
+MAX_PASSWORD_BYTES = 72
+
+
+class PasswordHasher:
+    # bcrypt runs in its own small thread pool: it releases the GIL, so a
+    # burst of logins uses spare cores without stalling the event loop or
+    # queueing behind other asyncio.to_thread work
+    def __init__(self, rounds=12, workers=2):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.rounds)).decode()
+
+    def _verify(self, password, stored):
+        # Returns (matches, needs_rehash). Records saved before hashing was
+        # introduced hold the plaintext password; they are compared in
+        # constant time and flagged so login can replace them with a hash.
+        if not stored.startswith(BCRYPT_PREFIXES):
+            matches = hmac.compare_digest(password.encode(), stored.encode())
+            return matches, len(password.encode()) <= MAX_PASSWORD_BYTES
+        try:
+            matches = bcrypt.checkpw(password.encode(), stored.encode())
+        except ValueError:
+            # Over bcrypt's 72-byte limit, so it cannot be this password
+            return False, False
+        if not matches:
+            return False, False
+        return True, int(stored.split("$")[2]) != self.rounds
+
+    async def hash(self, password):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._hash, password)
+
+    async def verify(self, password, stored):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._verify, password, stored)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenSigner:
+    # Stateless session tokens: base64url(JSON claims) "." base64url(HMAC-SHA256).
+    # Verifying one is a hash in memory, with no database lookup.
+
+    def __init__(self, secret=None, ttl=12 * 3600):
+        if not secret:
+            logger.warning("AUTH_SECRET is not set; tokens will not survive a restart or work across processes")
+            secret = secrets.token_hex(32)
+        self._key = secret.encode()
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, username):
+        claims = {"sub": username, "exp": int(time.time() + self.ttl)}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        # Returns the claims, or None for a forged, malformed or expired token
+        payload, _, signature = token.partition(".")
+        # Bytes, since compare_digest rejects non-ASCII str from a client
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if claims.get("exp", 0) < time.time():
+            return None
+        return claims
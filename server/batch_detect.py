@@ -0,0 +1,391 @@
+"""Run the detector offline over image directories and video files.
+
+Frames go through the same preprocessing, model and post-processing as
+/detect (confidence threshold, class filter, label names, boxes mapped back
+to the original image), without HTTP or base64. Images are decoded on a
+thread pool ahead of the model and videos are read on a background thread,
+so decoding overlaps inference; frames are batched through the model and
+one record per frame is written as soon as its batch is done:
+
+    {"source": "footage/a.mp4", "frame": 120, "timestamp": 4.0,
+     "width": 1920, "height": 1080, "detections": [{"label": ..., "confidence": ..., "box": [...]}]}
+
+Re-running the same command resumes: frames already in the output are
+skipped. Parquet output (needs pyarrow) is a directory of part files, each
+written complete, so an interrupted run never leaves a corrupt file. Run
+from the server directory:
+
+    python batch_detect.py photos/ footage/ --output detections.ndjson
+    python batch_detect.py archive.mp4 --video-stride 10 --format parquet --output detections/
+    python batch_detect.py photos/ --classes chair desk --confidence 0.5 --output chairs.ndjson
+"""
+import argparse
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from inference import (
+    CONFIDENCE_THRESHOLD,
+    DEFAULT_IMAGE_SIZE,
+    DEFAULT_MAX_DETECTIONS,
+    ENGINES,
+    LocalDetector,
+    artifact_max_batch,
+    decode_image,
+    detection_options,
+    export_model,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v")
+_DONE = object()
+
+
+def iter_sources(paths):
+    # Directories are walked recursively in sorted order, so the output
+    # order (and what a resumed run skips) is stable
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+                        yield os.path.join(dirpath, name)
+        else:
+            yield path
+
+
+def read_image(path, target_size):
+    try:
+        with open(path, "rb") as f:
+            return decode_image(f.read(), target_size)
+    except OSError:
+        return None, 1.0
+
+
+class FrameReader:
+    # Yields (source, frame index, timestamp, frame, scale) in input order.
+    # A background thread walks the sources: image decodes are handed to
+    # the decode pool, video frames are read in order (frames that are
+    # skipped by the stride or already done are grabbed without decoding).
+    # The bounded queue keeps at most `prefetch` frames ahead of the model.
+
+    def __init__(self, sources, done, target_size, decode_workers=4, prefetch=64, video_stride=1):
+        self._sources = sources
+        self._done = done
+        self._target_size = target_size
+        self._video_stride = max(1, video_stride)
+        self._pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._produce, name="frame-reader", daemon=True)
+        self.skipped = 0
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_video(self, path):
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            print(f"Could not open {path}, skipping", file=sys.stderr)
+            return
+        try:
+            index = 0
+            while not self._stopped.is_set():
+                if index % self._video_stride or (path, index) in self._done:
+                    if not capture.grab():
+                        break
+                    if index % self._video_stride == 0:
+                        self.skipped += 1
+                else:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                    if not self._put((path, index, timestamp, (frame, 1.0))):
+                        break
+                index += 1
+        finally:
+            capture.release()
+
+    def _produce(self):
+        try:
+            for path in self._sources:
+                if self._stopped.is_set():
+                    break
+                if path.lower().endswith(VIDEO_EXTENSIONS):
+                    self._read_video(path)
+                elif (path, 0) in self._done:
+                    self.skipped += 1
+                else:
+                    future = self._pool.submit(read_image, path, self._target_size)
+                    if not self._put((path, 0, None, future)):
+                        break
+            self._put(_DONE)
+        except BaseException as e:
+            self._put(e)
+
+    def __iter__(self):
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                source, index, timestamp, decoded = item
+                frame, scale = decoded if isinstance(decoded, tuple) else decoded.result()
+                yield source, index, timestamp, frame, scale
+        finally:
+            self.close()
+
+    def close(self):
+        self._stopped.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class NdjsonWriter:
+    def __init__(self, path, overwrite=False):
+        self.path = path
+        if overwrite and os.path.exists(path):
+            os.remove(path)
+        self._file = None
+
+    def completed(self):
+        # (source, frame) of every record already written. A last line cut
+        # short by an interrupted run is truncated away before appending.
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "rb+") as f:
+            valid = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                done.add((record["source"], record["frame"]))
+                valid += len(line)
+            f.truncate(valid)
+        return done
+
+    def write(self, records):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "a")
+        self._file.writelines(json.dumps(record) + "\n" for record in records)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class ParquetWriter:
+    # Buffers records and writes every flush_rows of them as a new part file
+
+    def __init__(self, path, overwrite=False, flush_rows=1000):
+        # Imported here so NDJSON output works without pyarrow installed
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.flush_rows = flush_rows
+        self.schema = pa.schema([
+            ("source", pa.string()),
+            ("frame", pa.int64()),
+            ("timestamp", pa.float64()),
+            ("width", pa.int32()),
+            ("height", pa.int32()),
+            ("error", pa.string()),
+            ("detections", pa.list_(pa.struct([
+                ("label", pa.string()),
+                ("confidence", pa.float64()),
+                ("box", pa.list_(pa.int32())),
+            ]))),
+        ])
+        if overwrite:
+            for part in self._parts():
+                os.remove(part)
+        os.makedirs(path, exist_ok=True)
+        self._run = uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self._rows = []
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def completed(self):
+        done = set()
+        for part in self._parts():
+            table = self._pq.read_table(part, columns=["source", "frame"])
+            done.update(zip(table["source"].to_pylist(), table["frame"].to_pylist()))
+        return done
+
+    def write(self, records):
+        self._rows.extend(records)
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        part = os.path.join(self.path, f"part-{self._run}-{self._sequence:05d}.parquet")
+        table = self._pa.Table.from_pylist(self._rows, schema=self.schema)
+        self._pq.write_table(table, part + ".tmp")
+        os.replace(part + ".tmp", part)
+        self._sequence += 1
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+
+class Progress:
+    def __init__(self, every):
+        self.every = every
+        self.frames = 0
+        self.invalid = 0
+        self.stage_seconds = defaultdict(float)
+        self.started = self._last_report = time.perf_counter()
+        self._last_frames = 0
+
+    def update(self, frames, timings):
+        self.frames += frames
+        for stage, seconds in timings.items():
+            self.stage_seconds[stage] += seconds
+        now = time.perf_counter()
+        if now - self._last_report >= self.every:
+            recent = (self.frames - self._last_frames) / (now - self._last_report)
+            print(
+                f"{self.frames} frames, {self.frames / (now - self.started):.1f} img/s "
+                f"({recent:.1f} img/s recent)",
+                file=sys.stderr,
+            )
+            self._last_report, self._last_frames = now, self.frames
+
+    def summary(self, skipped):
+        elapsed = time.perf_counter() - self.started
+        print(
+            f"Done: {self.frames} frames in {elapsed:.1f}s, {self.frames / max(elapsed, 1e-9):.1f} img/s"
+            f" ({self.invalid} invalid, {skipped} already in the output)",
+            file=sys.stderr,
+        )
+        if self.frames:
+            stages = ", ".join(
+                f"{stage} {seconds / self.frames * 1000:.1f}" for stage, seconds in self.stage_seconds.items()
+            )
+            print(f"Per frame ms: {stages}", file=sys.stderr)
+
+
+def frame_record(source, index, timestamp, frame, scale, detections=None, error=None):
+    record = {"source": source, "frame": index, "timestamp": timestamp}
+    if frame is not None:
+        record["width"] = round(frame.shape[1] * scale)
+        record["height"] = round(frame.shape[0] * scale)
+    else:
+        record["width"] = record["height"] = None
+    record["error"] = error
+    record["detections"] = detections or []
+    return record
+
+
+def run(args):
+    writer = (
+        ParquetWriter(args.output, args.overwrite) if args.format == "parquet"
+        else NdjsonWriter(args.output, args.overwrite)
+    )
+    done = writer.completed()
+    weights = export_model(args.weights, args.engine, imgsz=args.imgsz)
+    batch_size = min(args.batch_size, artifact_max_batch(weights) or args.batch_size)
+    detector = LocalDetector(weights, imgsz=args.imgsz, threads=args.threads or None)
+    detector.warmup()
+    options = detection_options(
+        classes=args.classes, confidence=args.confidence, max_detections=args.max_detections
+    )
+
+    reader = FrameReader(
+        iter_sources(args.paths), done, args.imgsz,
+        decode_workers=args.decode_workers,
+        prefetch=args.prefetch or batch_size * 4,
+        video_stride=args.video_stride,
+    )
+    progress = Progress(args.report_every)
+    batch = []
+
+    def flush_batch():
+        frames = [frame for _, _, _, frame, _ in batch]
+        scales = [scale for _, _, _, _, scale in batch]
+        results, timings = detector.detect(frames, scales, options)
+        writer.write([
+            frame_record(source, index, timestamp, frame, scale, detections)
+            for (source, index, timestamp, frame, scale), detections in zip(batch, results)
+        ])
+        progress.update(len(batch), timings)
+        batch.clear()
+
+    try:
+        for source, index, timestamp, frame, scale in reader:
+            if frame is None:
+                writer.write([frame_record(source, index, timestamp, None, scale, error="Invalid image")])
+                progress.invalid += 1
+                continue
+            batch.append((source, index, timestamp, frame, scale))
+            if len(batch) == batch_size:
+                flush_batch()
+        if batch:
+            flush_batch()
+    finally:
+        reader.close()
+        writer.close()
+    progress.summary(reader.skipped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Image or video files and directories")
+    parser.add_argument("--output", required=True, help="NDJSON file, or directory for --format parquet")
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    parser.add_argument("--overwrite", action="store_true", help="Start over instead of resuming")
+    parser.add_argument("--weights", default="./best.pt")
+    parser.add_argument("--engine", choices=ENGINES, default=os.getenv("DETECT_ENGINE", "pytorch"))
+    parser.add_argument("--imgsz", type=int, default=int(os.getenv("DETECT_IMAGE_SIZE", DEFAULT_IMAGE_SIZE)))
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = runtime default)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=0, help="Frames decoded ahead of the model (default 4 batches)")
+    parser.add_argument("--video-stride", type=int, default=1, help="Run every Nth video frame")
+    parser.add_argument("--classes", nargs="+", help="Only report these labels")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--max-detections", type=int, default=DEFAULT_MAX_DETECTIONS)
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        raise SystemExit(f"Not found: {', '.join(missing)}")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Login throughput and event-loop latency under concurrent logins.
+
+Runs bcrypt verification the way /login does (in the hashing pool) and,
+for comparison, inline on the event loop, while a probe task measures how
+late the loop wakes up. Run from the server directory:
+
+    python -m benchmarks.bench_login --concurrency 32 --logins 200
+    python -m benchmarks.bench_login --url http://localhost:8000 --username admin --password secret
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import PasswordHasher
+from benchmarks.stats import percentile
+
+PROBE_INTERVAL = 0.005
+
+
+async def probe_loop_lag(lags, stop):
+    # How much later than requested the loop gets back to a sleeping task
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run_logins(hasher, stored, mode, concurrency, logins):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            if mode == "pool":
+                await hasher.verify("correct horse", stored)
+            else:
+                hasher._verify("correct horse", stored)
+                await asyncio.sleep(0)
+
+    lags = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    return logins / elapsed, lags or [0.0]
+
+
+def post_login(url, username, password):
+    body = json.dumps({"username": username, "password": password}).encode()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def bench_server(args):
+    url = args.url.rstrip("/") + "/login"
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        start = time.perf_counter()
+        samples = list(pool.map(lambda _: post_login(url, args.username, args.password), range(args.logins)))
+        elapsed = time.perf_counter() - start
+    print(f"{args.logins} logins, concurrency {args.concurrency}: {args.logins / elapsed:.1f} logins/s")
+    print(
+        f"latency ms: p50 {percentile(samples, 0.5) * 1000:.1f}"
+        f"  p95 {percentile(samples, 0.95) * 1000:.1f}  p99 {percentile(samples, 0.99) * 1000:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=2, help="Hashing pool threads")
+    parser.add_argument("--url", help="Benchmark a running server's /login instead")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    if args.url:
+        bench_server(args)
+        return
+
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers)
+    stored = hasher._hash("correct horse")
+    print(f"{args.logins} logins, concurrency {args.concurrency}, bcrypt cost {args.rounds}, {args.workers} hashing threads")
+    print(f"{'mode':<8} {'logins/s':>9} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+    for mode in ("pool", "inline"):
+        rate, lags = asyncio.run(run_logins(hasher, stored, mode, args.concurrency, args.logins))
+        print(
+            f"{mode:<8} {rate:>9.1f} {statistics.median(lags) * 1000:>11.2f}"
+            f" {percentile(lags, 0.99) * 1000:>11.2f} {max(lags) * 1000:>11.2f}"
+        )
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
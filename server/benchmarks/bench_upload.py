@@ -0,0 +1,108 @@
+"""Compare the JSON/base64 and binary /detect upload paths.
+
+Reports bytes on the wire and server-side CPU time spent turning a request
+body into a decoded frame, per frame. Run from the server directory:
+
+    python -m benchmarks.bench_upload path/to/jpegs --repeat 50
+    python -m benchmarks.bench_upload path/to/jpegs --url http://localhost:8000
+"""
+import argparse
+import base64
+import json
+import os
+import time
+import urllib.request
+import uuid
+
+from inference import decode_base64_image, decode_image
+from models import ImageInput
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_corpus(path):
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    frames = []
+    for image_path in paths:
+        with open(image_path, "rb") as f:
+            frames.append(f.read())
+    if not frames:
+        raise SystemExit(f"No images found in {path}")
+    return frames
+
+
+def json_body(raw):
+    return json.dumps({"image_base64": base64.b64encode(raw).decode()}).encode()
+
+
+def multipart_body(raw, boundary):
+    return b"".join([
+        f"--{boundary}\r\n".encode(),
+        b'Content-Disposition: form-data; name="image"; filename="frame.jpg"\r\n',
+        b"Content-Type: image/jpeg\r\n\r\n",
+        raw,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+
+
+def parse_json(body):
+    data = ImageInput(**json.loads(body))
+    return decode_base64_image(data.image_base64)
+
+
+def cpu_per_frame(fn, bodies, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for body in bodies:
+            fn(body)
+    return (time.process_time() - start) / (repeat * len(bodies))
+
+
+def post(url, body, content_type):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="JPEG file or directory of JPEGs")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--url", help="Server base URL to also measure end-to-end latency")
+    args = parser.parse_args()
+
+    frames = load_corpus(args.corpus)
+    boundary = uuid.uuid4().hex
+    json_bodies = [json_body(raw) for raw in frames]
+    multipart_bodies = [multipart_body(raw, boundary) for raw in frames]
+
+    paths = [
+        ("json/base64", json_bodies, parse_json, "/detect", "application/json"),
+        ("octet-stream", frames, decode_image, "/detect/binary", "application/octet-stream"),
+        ("multipart", multipart_bodies, None, "/detect/binary", f"multipart/form-data; boundary={boundary}"),
+    ]
+
+    print(f"{len(frames)} frames, {args.repeat} repeats")
+    print(f"{'path':<14} {'bytes/frame':>12} {'cpu ms/frame':>13} {'latency ms':>11}")
+    for name, bodies, parse, route, content_type in paths:
+        size = sum(len(body) for body in bodies) / len(bodies)
+        # Multipart bodies are parsed by Starlette, so only the end-to-end number applies
+        cpu = f"{cpu_per_frame(parse, bodies, args.repeat) * 1000:.3f}" if parse else "-"
+        latency = ""
+        if args.url:
+            samples = [post(args.url.rstrip("/") + route, body, content_type) for body in bodies]
+            latency = f"{sum(samples) / len(samples) * 1000:.2f}"
+        print(f"{name:<14} {size:>12.0f} {cpu:>13} {latency:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compare exported inference engines against the eager PyTorch model.
+
+For each engine reports per-batch latency, images/sec and mAP drift: the
+engine's detections scored against the eager model's detections (at the
+server's confidence threshold) on the same held-out images. A drift-free
+export scores 1.0. Run from the server directory:
+
+    python -m benchmarks.compare_engines path/to/heldout --engines onnx openvino torchscript
+    python -m benchmarks.compare_engines path/to/heldout --engines openvino --int8 --data data.yaml
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+from ultralytics import YOLO
+
+from benchmarks.stats import percentile
+from inference import CONFIDENCE_THRESHOLD, DEFAULT_IMAGE_SIZE, ENGINES, decode_image, export_model
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "models"))
+from evaluate import DetectionEvaluator  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_frames(path):
+    frames = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(path, name), "rb") as f:
+                frame, _ = decode_image(f.read())
+            if frame is not None:
+                frames.append(frame)
+    if not frames:
+        raise SystemExit(f"No images found in {path}")
+    return frames
+
+
+def predict(model, frames, batch_size, imgsz, conf):
+    latencies, outputs = [], []
+    for start in range(0, len(frames), batch_size):
+        batch = frames[start:start + batch_size]
+        began = time.perf_counter()
+        results = model(batch, imgsz=imgsz, conf=conf, verbose=False)
+        latencies.append(time.perf_counter() - began)
+        for result in results:
+            data = result.boxes.data.cpu()
+            # Class ids shift by one: the evaluator reserves 0 for background
+            outputs.append({"boxes": data[:, :4], "scores": data[:, -2], "labels": data[:, -1].long() + 1})
+    return latencies, outputs
+
+
+def mean_average_precision(predictions, references):
+    # Scored with the training code's COCO evaluator, so drift here and
+    # validation mAP in training are the same metric
+    evaluator = DetectionEvaluator()
+    evaluator.update(predictions, references)
+    results = evaluator.compute()
+    return results["map_50"], results["map"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", help="Directory of held-out images")
+    parser.add_argument("--weights", default="./best.pt")
+    parser.add_argument("--engines", nargs="+", default=["onnx", "openvino", "torchscript"], choices=ENGINES)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMAGE_SIZE)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = runtime default)")
+    parser.add_argument("--half", action="store_true")
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--data", help="Calibration dataset yaml for --int8")
+    args = parser.parse_args()
+
+    if args.threads:
+        os.environ["OMP_NUM_THREADS"] = str(args.threads)
+        torch.set_num_threads(args.threads)
+
+    frames = load_frames(args.images)
+    eager = YOLO(args.weights)
+    predict(eager, frames[:args.batch], args.batch, args.imgsz, CONFIDENCE_THRESHOLD)
+    eager_latency, references = predict(eager, frames, args.batch, args.imgsz, CONFIDENCE_THRESHOLD)
+
+    rows = [("pytorch (eager)", eager_latency, 1.0, 1.0)]
+    for engine in args.engines:
+        if engine == "pytorch":
+            continue
+        artifact = export_model(args.weights, engine, args.imgsz, args.half, args.int8, args.data)
+        model = YOLO(artifact, task="detect")
+        # Warm up once, then time at the server threshold and score at a low one
+        predict(model, frames[:args.batch], args.batch, args.imgsz, CONFIDENCE_THRESHOLD)
+        latency, _ = predict(model, frames, args.batch, args.imgsz, CONFIDENCE_THRESHOLD)
+        _, predictions = predict(model, frames, args.batch, args.imgsz, 0.001)
+        map50, map50_95 = mean_average_precision(predictions, references)
+        rows.append((f"{engine} ({os.path.basename(artifact)})", latency, map50, map50_95))
+
+    print(f"{len(frames)} images, batch {args.batch}, imgsz {args.imgsz}")
+    print(f"{'engine':<40} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'mAP50':>7} {'mAP50-95':>9}")
+    for name, latency, map50, map50_95 in rows:
+        throughput = len(frames) / sum(latency)
+        p50, p95 = percentile(latency, 0.5) * 1000, percentile(latency, 0.95) * 1000
+        print(f"{name:<40} {p50:>8.1f} {p95:>8.1f} {throughput:>8.1f} {map50:>7.3f} {map50_95:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
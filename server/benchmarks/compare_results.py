@@ -0,0 +1,88 @@
+"""Compare two benchmarks.suite result files.
+
+Rows are matched on (scenario, operation, room_size). A row regresses when
+throughput drops, or p95/p99 latency, CPU or RSS grows, by more than
+--threshold percent; any regression, or a row the suite marked invalid
+because it had errors, makes the exit status 1 so the comparison can gate
+CI. Run from the server directory:
+
+    python -m benchmarks.compare_results baseline.json bench-results.json --threshold 10
+"""
+import argparse
+import json
+
+# metric -> +1 when higher is better, -1 when lower is better
+METRICS = {
+    "throughput_rps": 1,
+    "p95_ms": -1,
+    "p99_ms": -1,
+    "cpu_seconds": -1,
+    "rss_mb": -1,
+}
+
+
+def row_key(row):
+    return row["scenario"], row["operation"], row.get("room_size")
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return data["meta"], {row_key(row): row for row in data["results"]}
+
+
+def change(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    args = parser.parse_args()
+
+    base_meta, base_rows = load(args.baseline)
+    new_meta, new_rows = load(args.candidate)
+    print(f"baseline  {base_meta.get('commit')} {base_meta.get('timestamp')} {base_meta.get('target')}")
+    print(f"candidate {new_meta.get('commit')} {new_meta.get('timestamp')} {new_meta.get('target')}")
+    print()
+    header = f"{'scenario':<7} {'operation':<15} {'size':>6}" + "".join(f" {metric:>16}" for metric in METRICS)
+    print(header)
+
+    regressions = []
+    invalid = []
+    for key in sorted(base_rows.keys() & new_rows.keys(), key=str):
+        old, new = base_rows[key], new_rows[key]
+        if not (old.get("valid", True) and new.get("valid", True)):
+            invalid.append(key)
+            scenario, operation, size = key
+            print(f"{scenario:<7} {operation:<15} {size if size is not None else '-':>6} invalid: requests failed")
+            continue
+        cells = []
+        for metric, direction in METRICS.items():
+            delta = change(old[metric], new[metric])
+            regressed = delta * direction < -args.threshold
+            if regressed:
+                regressions.append((key, metric, delta))
+            cells.append(f" {delta:>+14.1f}%{'!' if regressed else ' '}")
+        scenario, operation, size = key
+        print(f"{scenario:<7} {operation:<15} {size if size is not None else '-':>6}" + "".join(cells))
+
+    for key in sorted(base_rows.keys() ^ new_rows.keys(), key=str):
+        print(f"only in {'baseline' if key in base_rows else 'candidate'}: {key}")
+
+    print()
+    if invalid:
+        print(f"{len(invalid)} row(s) had errors and were not compared")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:g}%")
+    if invalid or regressions:
+        raise SystemExit(1)
+    print(f"No regressions beyond {args.threshold:g}%")
+
+
+if __name__ == "__main__":
+    main()
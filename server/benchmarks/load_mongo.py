@@ -0,0 +1,126 @@
+"""Concurrent room/inventory load against MongoDB through the API.
+
+Drives the FastAPI app in-process (no detector, no network hop) with a mix
+of room reads, item inserts and room patches, then prints throughput,
+latency percentiles and the driver's pool / wait-queue metrics. Point it
+at a local mongod, or use --mock for an in-memory mongomock stand-in
+(pool metrics stay empty there, since no real connections are made).
+Run from the server directory:
+
+    python -m benchmarks.load_mongo --uri mongodb://localhost:27017 --concurrency 64 --requests 5000
+    python -m benchmarks.load_mongo --mock --concurrency 64 --requests 2000
+    MONGO_MAX_POOL_SIZE=8 python -m benchmarks.load_mongo --uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+import main
+from benchmarks.stats import percentile
+from indexes import ensure_indexes
+from metrics import render_metrics
+
+OPERATIONS = ("get_room", "add_item", "patch_room")
+
+
+async def seed(http, rooms, items_per_room):
+    for r in range(rooms):
+        room = {
+            "id": f"load-{r}",
+            "name": f"Load room {r}",
+            "lastCheckedTime": "",
+            "inventory": [
+                {"id": f"seed-{i}", "name": "Chair", "qrCode": f"load-{r}-seed-{i}"}
+                for i in range(items_per_room)
+            ],
+        }
+        response = await http.post("/rooms", json=room)
+        response.raise_for_status()
+
+
+async def worker(http, rooms, queue, latencies, errors):
+    while True:
+        try:
+            n = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        room_id = f"load-{random.randrange(rooms)}"
+        operation = random.choices(OPERATIONS, weights=(8, 1, 1))[0]
+        start = time.perf_counter()
+        if operation == "get_room":
+            response = await http.get(f"/rooms/{room_id}")
+        elif operation == "add_item":
+            item = {"id": f"item-{n}", "name": "Desk", "qrCode": f"{room_id}-item-{n}"}
+            response = await http.post(f"/rooms/{room_id}/inventory", json=item)
+        else:
+            response = await http.patch(f"/rooms/{room_id}", json={"lastCheckedTime": str(time.time())})
+        latencies[operation].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors[response.status_code] += 1
+
+
+async def run(args):
+    if args.mock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        main.connect_mongo(AsyncMongoMockClient())
+    else:
+        main.MONGO_URI = args.uri
+        main.connect_mongo()
+    if not args.cache:
+        # Measure the database path, not the read-through cache
+        main.room_cache = None
+    await main.db["rooms"].delete_many({"id": {"$regex": "^load-"}})
+    await main.db["items"].delete_many({"roomId": {"$regex": "^load-"}})
+    await ensure_indexes(main.db, main.inventory_store)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load") as http:
+        await seed(http, args.rooms, args.items)
+        queue = asyncio.Queue()
+        for n in range(args.requests):
+            queue.put_nowait(n)
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(http, args.rooms, queue, latencies, errors) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    main.client.close()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.1f} req/s")
+    print(f"{'operation':<11} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for operation in OPERATIONS:
+        samples = latencies[operation]
+        if samples:
+            print(
+                f"{operation:<11} {len(samples):>6} {percentile(samples, 0.5) * 1000:>8.2f}"
+                f" {percentile(samples, 0.95) * 1000:>8.2f} {percentile(samples, 0.99) * 1000:>8.2f}"
+            )
+    if errors:
+        print("errors by status:", dict(errors))
+    print()
+    for line in render_metrics().splitlines():
+        if line.startswith("mongo_pool") and "_bucket" not in line:
+            print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--uri", help="MongoDB URI of a local mongod")
+    target.add_argument("--mock", action="store_true", help="Use an in-memory mongomock stand-in")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--items", type=int, default=50, help="Seed items per room")
+    parser.add_argument("--cache", action="store_true", help="Keep the room read cache enabled")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,7 @@
+# Shared by every benchmark report, so their percentiles agree
+
+
+def percentile(samples, q):
+    # Nearest-rank percentile, q in [0, 1]
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
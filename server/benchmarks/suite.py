@@ -0,0 +1,299 @@
+"""Reproducible load/benchmark suite for the API.
+
+Scenarios:
+
+  detect  POST /detect/binary with a corpus of JPEGs, at a fixed
+          concurrency and optionally a fixed offered frame rate (--fps)
+  crud    room and inventory reads and writes against rooms seeded with
+          --room-sizes items each (10 to 10k by default), per room size
+
+Each (scenario, operation) row reports requests, errors, throughput,
+p50/p95/p99 latency, CPU seconds and RSS. With --fps, latency is measured
+from each request's scheduled start, so a server that falls behind shows
+up as queueing instead of being hidden by a slower client.
+
+By default the app runs in-process with an in-memory mongomock database
+(--mongo-uri for a local mongod); CPU and RSS then cover client and
+server together. Operations mongomock cannot run (get_item needs a
+positional projection in the embedded layout) are skipped there. With
+--url the suite drives a running server instead, and --server-pid samples
+that process's CPU and RSS from /proc.
+
+Results go to a JSON file (--output); compare two runs with
+benchmarks.compare_results. A row with errors is marked invalid, since its
+latencies mix failures in, and makes the run exit with status 1. Run from
+the server directory:
+
+    python -m benchmarks.suite crud --room-sizes 10 100 1000 10000
+    python -m benchmarks.suite detect --corpus path/to/jpegs --concurrency 8 --fps 30
+    python -m benchmarks.suite detect crud --url http://localhost:8000 --server-pid 1234
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.bench_upload import load_corpus
+from benchmarks.stats import percentile
+
+SCENARIOS = ("detect", "crud")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+class ResourceProbe:
+    # CPU seconds and RSS of this process, or of another one via /proc
+
+    def __init__(self, pid=None):
+        self.pid = pid
+
+    def cpu_seconds(self):
+        if self.pid is None:
+            return time.process_time()
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def rss_mb(self):
+        with open(f"/proc/{self.pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 2**20
+
+    def peak_rss_mb(self):
+        if self.pid is None:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+        return None
+
+
+async def run_load(send, total, concurrency, rate=0.0):
+    # Closed loop by default; with rate, request i is due at start + i / rate
+    latencies = []
+    errors = 0
+    indices = iter(range(total))
+    start = time.perf_counter()
+
+    async def worker():
+        nonlocal errors
+        for i in indices:
+            due = start + i / rate if rate else time.perf_counter()
+            if rate:
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            try:
+                status = await send(i)
+            except httpx.HTTPError:
+                status = 599
+            latencies.append(time.perf_counter() - due)
+            if status >= 400:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def measure(probe, scenario, operation, send, total, concurrency, rate=0.0, **labels):
+    cpu_before = probe.cpu_seconds()
+    latencies, errors, elapsed = await run_load(send, total, concurrency, rate)
+    row = {
+        "scenario": scenario,
+        "operation": operation,
+        **labels,
+        "requests": total,
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "cpu_seconds": round(probe.cpu_seconds() - cpu_before, 3),
+        "rss_mb": round(probe.rss_mb(), 1),
+        "valid": errors == 0,
+    }
+    label = " ".join(f"{k}={v}" for k, v in labels.items())
+    print(
+        f"{scenario:<7} {operation:<15} {label:<16} {row['throughput_rps']:>9.1f} req/s"
+        f"  p50 {row['p50_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  p99 {row['p99_ms']:>8.2f} ms"
+        f"  cpu {row['cpu_seconds']:>7.2f}s  rss {row['rss_mb']:>7.1f} MB  errors {errors}"
+        + ("" if row["valid"] else "  INVALID")
+    )
+    return row
+
+
+async def bench_detect(http, probe, args):
+    frames = load_corpus(args.corpus)
+
+    async def send(i):
+        response = await http.post(
+            "/detect/binary",
+            content=frames[i % len(frames)],
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        return response.status_code
+
+    return [await measure(probe, "detect", "detect_binary", send, args.frames, args.concurrency, args.fps)]
+
+
+async def seed_room(http, room_id, size):
+    await http.delete(f"/rooms/{room_id}")
+    response = await http.post("/rooms", json={"id": room_id, "name": f"Bench {size}", "lastCheckedTime": ""})
+    response.raise_for_status()
+    for start in range(0, size, 1000):
+        items = [
+            {"id": f"item-{n}", "name": "Chair", "qrCode": f"{room_id}-{n}"}
+            for n in range(start, min(size, start + 1000))
+        ]
+        response = await http.post(f"/rooms/{room_id}/inventory/bulk?ordered=false", json=items)
+        response.raise_for_status()
+
+
+async def bench_crud(http, probe, args, unsupported=()):
+    rows = []
+    for size in args.room_sizes:
+        room_id = f"bench-{size}"
+        await seed_room(http, room_id, size)
+        requests = max(10, args.requests // max(1, size // 1000))
+        operations = {
+            "get_room": lambda i: http.get(f"/rooms/{room_id}"),
+            "get_inventory": lambda i: http.get(f"/rooms/{room_id}/inventory"),
+            "get_item": lambda i: http.get(f"/rooms/{room_id}/inventory/item-{i % size}"),
+            "add_item": lambda i: http.post(
+                f"/rooms/{room_id}/inventory",
+                json={"id": f"new-{i}", "name": "Desk", "qrCode": f"{room_id}-new-{i}"},
+            ),
+            "patch_room": lambda i: http.patch(f"/rooms/{room_id}", json={"lastCheckedTime": str(i)}),
+            "list_summary": lambda i: http.get("/rooms?view=summary&limit=100"),
+        }
+        for operation, request in operations.items():
+            if operation in unsupported:
+                print(f"crud    {operation:<15} room_size={size:<6} skipped: not supported by this database")
+                continue
+            async def send(i, request=request):
+                return (await request(i)).status_code
+
+            rows.append(await measure(
+                probe, "crud", operation, send, requests, args.concurrency, room_size=size
+            ))
+        await http.delete(f"/rooms/{room_id}")
+    return rows
+
+
+@asynccontextmanager
+async def in_process_client(args, scenarios):
+    import main
+    from inventory_store import CollectionInventoryStore
+
+    if args.mongo_uri:
+        main.MONGO_URI = args.mongo_uri
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+
+        connect_mongo = main.connect_mongo
+        mock = AsyncMongoMockClient()
+        main.connect_mongo = lambda: connect_mongo(mock)
+    if "detect" not in scenarios:
+        # CRUD-only runs skip loading the model
+        async def skip_detector():
+            main.detector_status.update(state="skipped")
+
+        main.load_detector = skip_detector
+        main.DETECT_BACKGROUND_LOAD = True
+    if not args.cache:
+        # Measure the database path, not the read-through cache
+        main.room_cache = None
+
+    async with main.app.router.lifespan_context(main.app):
+        unsupported = set()
+        if not args.mongo_uri and not isinstance(main.inventory_store, CollectionInventoryStore):
+            # mongomock has no positional projection, so every get_item is a 500
+            unsupported.add("get_item")
+        # Server errors count as 500s in the results instead of aborting the run
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            yield http, unsupported
+
+
+@asynccontextmanager
+async def remote_client(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, headers=headers, timeout=60) as http:
+        yield http, set()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    if "detect" in scenarios and not args.corpus:
+        raise SystemExit("The detect scenario needs --corpus")
+    probe = ResourceProbe(args.server_pid)
+    client = remote_client(args) if args.url else in_process_client(args, scenarios)
+    rows = []
+    async with client as (http, unsupported):
+        if "detect" in scenarios:
+            rows += await bench_detect(http, probe, args)
+        if "crud" in scenarios:
+            rows += await bench_crud(http, probe, args, unsupported)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "target": args.url or ("in-process " + ("mongod" if args.mongo_uri else "mongomock")),
+            "peak_rss_mb": probe.peak_rss_mb(),
+            "args": {k: v for k, v in vars(args).items() if k != "scenarios"},
+        },
+        "results": rows,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+    invalid = [row for row in rows if not row["valid"]]
+    if invalid:
+        raise SystemExit(f"{len(invalid)} row(s) had errors; their latencies are not comparable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help="detect and/or crud (default: both)")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--server-pid", type=int, help="With --url, report this process's CPU and RSS")
+    parser.add_argument("--token", help="Bearer token for servers running with AUTH_REQUIRED=true")
+    parser.add_argument("--mongo-uri", help="In-process app against a local mongod instead of mongomock")
+    parser.add_argument("--cache", action="store_true", help="Keep the room read cache enabled")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--corpus", help="JPEG file or directory for the detect scenario")
+    parser.add_argument("--frames", type=int, default=200, help="Detect requests to send")
+    parser.add_argument("--fps", type=float, default=0.0, help="Offered frame rate; 0 sends as fast as possible")
+    parser.add_argument("--room-sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per CRUD operation (scaled down for big rooms)")
+    parser.add_argument("--output", default="bench-results.json")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
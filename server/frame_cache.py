@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from metrics import Counter
+
+cache_hits_counter = Counter(
+    "detect_cache_hits_total",
+    "Frames answered from the near-duplicate cache, each one a saved inference",
+)
+cache_misses_counter = Counter(
+    "detect_cache_misses_total",
+    "Frames with no near-duplicate in the cache that went through the model",
+)
+
+
+def frame_hash(frame):
+    # 64-bit difference hash of a 9x8 grayscale thumbnail: each bit says
+    # whether a pixel is brighter than its right neighbour, so the hash
+    # survives JPEG noise and small exposure changes.
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = thumbnail[:, 1:] > thumbnail[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def decode_and_hash(decode, payload, target_size=None):
+    frame, scale = decode(payload, target_size)
+    return frame, scale, None if frame is None else frame_hash(frame)
+
+
+class FrameCache:
+    # Bounded LRU of recent detections keyed by (namespace, frame hash).
+    # A lookup hits when an unexpired entry in the same namespace is within
+    # max_distance differing bits of the new frame's hash.
+
+    def __init__(self, max_entries=512, ttl=3.0, max_distance=3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, phash):
+        now = time.monotonic()
+        with self._lock:
+            match = None
+            for key in reversed(self._entries):
+                detections, expires = self._entries[key]
+                if expires <= now:
+                    continue
+                if key[0] == namespace and (key[1] ^ phash).bit_count() <= self.max_distance:
+                    match = key
+                    break
+            if match is None:
+                cache_misses_counter.inc()
+                return None
+            self._entries.move_to_end(match)
+            cache_hits_counter.inc()
+            return self._entries[match][0]
+
+    def put(self, namespace, phash, detections):
+        with self._lock:
+            self._entries[(namespace, phash)] = (detections, time.monotonic() + self.ttl)
+            self._entries.move_to_end((namespace, phash))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,95 @@
+import logging
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Indexes the API relies on. The unique ones double as the duplicate
+# checks for create_room and add_user, so inserts no longer need a
+# read-then-insert round trip.
+ROOM_INDEXES = [
+    IndexModel([("id", ASCENDING)], unique=True, name="id"),
+]
+USER_INDEXES = [
+    IndexModel([("username", ASCENDING)], unique=True, name="username"),
+    IndexModel([("email", ASCENDING)], unique=True, name="email"),
+]
+
+
+def index_specs(db, inventory_store):
+    return [
+        (db["rooms"], ROOM_INDEXES),
+        (db["users"], USER_INDEXES),
+        *inventory_store.index_specs(),
+    ]
+
+
+def hot_queries(db, inventory_store):
+    # (collection, filter) pairs for the lookups on the request path;
+    # the values are placeholders, only the query shape matters to the planner
+    return [
+        (db["rooms"], {"id": ""}),
+        (db["users"], {"username": ""}),
+        (db["users"], {"email": ""}),
+        *inventory_store.hot_queries(),
+    ]
+
+
+class UniqueIndexError(Exception):
+    pass
+
+
+async def ensure_indexes(db, inventory_store):
+    # Indexes are created one at a time so a single failure (typically a
+    # unique index over data that already has duplicates) is reported and
+    # the rest still get built. create_index is a no-op when it exists.
+    # Unique indexes are the only duplicate checks left, so startup fails
+    # if any of them is missing rather than silently accepting duplicates.
+    missing = []
+    try:
+        for collection, indexes in index_specs(db, inventory_store):
+            for index in indexes:
+                try:
+                    await collection.create_indexes([index])
+                except OperationFailure as e:
+                    logger.error("Could not create index %s on %s: %s", index.document["name"], collection.name, e)
+                    if index.document.get("unique"):
+                        missing.append(f"{collection.name}.{index.document['name']}")
+    except ConnectionFailure as e:
+        raise UniqueIndexError(f"Could not reach MongoDB to create indexes: {e}") from e
+    if missing:
+        raise UniqueIndexError(f"Could not create unique indexes: {', '.join(missing)}")
+
+
+def _plan_stages(plan):
+    # Newer servers wrap the classic plan tree in "queryPlan"
+    plan = plan.get("queryPlan", plan)
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def find_collection_scans(db, inventory_store):
+    # Returns "collection filter" descriptions of hot queries whose winning
+    # plan still scans the whole collection
+    scans = []
+    for collection, query in hot_queries(db, inventory_store):
+        explained = await collection.find(query).explain()
+        stages = set(_plan_stages(explained["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            scans.append(f"{collection.name} {sorted(query)}")
+    return scans
+
+
+async def verify_indexes(db, inventory_store):
+    try:
+        scans = await find_collection_scans(db, inventory_store)
+    except Exception:
+        logger.exception("Could not explain hot queries")
+        return None
+    for scan in scans:
+        logger.warning("Query still plans a COLLSCAN: %s", scan)
+    return scans
@@ -0,0 +1,514 @@
+import asyncio
+import base64
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from metrics import Histogram
+
+CONFIDENCE_THRESHOLD = 0.75
+DEFAULT_MAX_DETECTIONS = 300
+DEFAULT_IMAGE_SIZE = 640
+
+# Export formats that can replace eager PyTorch on CPU-only hosts
+ENGINES = ("pytorch", "onnx", "openvino", "torchscript")
+# Engines exported with a dynamic batch axis; the others are traced for a
+# single frame and can only run batches of one
+DYNAMIC_BATCH_ENGINES = ("pytorch", "onnx", "openvino")
+
+logger = logging.getLogger(__name__)
+
+batch_size_histogram = Histogram(
+    "detect_batch_size",
+    "Number of frames run through the model in one forward pass",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+queue_wait_histogram = Histogram(
+    "detect_queue_wait_seconds",
+    "Time a frame waited in the inference queue before its batch started",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+# decode is per frame; the other stages are per batch
+stage_histogram = Histogram(
+    "detect_stage_seconds",
+    "Time spent in each detection pipeline stage",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    labelnames=("stage",),
+)
+
+LETTERBOX_FILL = 114
+
+# Markers whose segment carries the frame size (SOF0-SOF15 minus DHT/JPG/DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+_Request = namedtuple("_Request", "frame scale options future enqueued")
+
+# Per-worker model instance (one per thread or per process)
+_worker_state = threading.local()
+
+
+class InferenceOverloaded(Exception):
+    pass
+
+
+def jpeg_size(image_data):
+    # (width, height) read from the JPEG frame header, or None for other formats
+    view = memoryview(image_data)
+    if len(view) < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(view):
+        if view[i] != 0xFF:
+            return None
+        marker = view[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height = (view[i + 5] << 8) | view[i + 6]
+            width = (view[i + 7] << 8) | view[i + 8]
+            return width, height
+        i += 2 + ((view[i + 2] << 8) | view[i + 3])
+    return None
+
+
+def decode_image(image_data, target_size=None):
+    # Returns (frame, scale) where scale maps frame pixels back to the
+    # original image. Large JPEGs are downscaled by libjpeg while decoding
+    # (IMREAD_REDUCED_*) as long as they stay at least target_size on their
+    # longest side, so the full-resolution image is never materialized.
+    started = time.perf_counter()
+    flag, factor = cv2.IMREAD_COLOR, 1
+    size = jpeg_size(image_data) if target_size else None
+    if size:
+        for candidate, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if max(size) // candidate >= target_size:
+                flag, factor = reduced_flag, candidate
+                break
+
+    frame = cv2.imdecode(np.frombuffer(image_data, np.uint8), flag)
+    stage_histogram.labels(stage="decode").observe(time.perf_counter() - started)
+    if frame is None:
+        return None, 1.0
+    # libjpeg scales both sides by exactly 1/factor; comparing frame and
+    # header widths would be wrong when EXIF orientation swaps the axes
+    return frame, float(factor)
+
+
+def decode_base64_image(image_base64, target_size=None):
+    return decode_image(base64.b64decode(image_base64), target_size)
+
+
+def export_model(weights, engine, imgsz=DEFAULT_IMAGE_SIZE, half=False, int8=False, data=None):
+    # Returns the path of an optimized artifact for `engine`, exporting it
+    # next to the weights on first use. The file name encodes the export
+    # settings so changing them never picks up a stale artifact.
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown inference engine: {engine}")
+    if engine == "pytorch":
+        return weights
+
+    # Exports run on the CPU, where ultralytics only honours half and int8
+    # for OpenVINO; for ONNX and TorchScript it quietly exports FP32, so the
+    # artifact is named and exported for the precision it really has
+    if engine != "openvino" and (half or int8):
+        logger.warning("%s export is FP32 on CPU; ignoring half/int8", engine)
+        half = int8 = False
+    precision = "int8" if int8 else "fp16" if half else "fp32"
+    stem, _ = os.path.splitext(weights)
+    suffix = "_openvino_model" if engine == "openvino" else f".{engine}"
+    artifact = f"{stem}-{imgsz}-{precision}{suffix}"
+    if os.path.exists(artifact):
+        return artifact
+
+    if int8 and not data:
+        raise ValueError("INT8 export needs a calibration dataset (DETECT_INT8_DATA)")
+    from ultralytics import YOLO
+    exported = YOLO(weights).export(
+        format=engine,
+        imgsz=imgsz,
+        half=half,
+        int8=int8,
+        data=data,
+        # Dynamic batch axis so micro-batches of any size can run
+        dynamic=engine in DYNAMIC_BATCH_ENGINES,
+    )
+    os.replace(exported, artifact)
+    return artifact
+
+
+def artifact_engine(weights):
+    # The engine of a .pt file or of an artifact returned by export_model
+    if weights.rstrip("/").endswith("_openvino_model"):
+        return "openvino"
+    engine = os.path.splitext(weights)[1].lstrip(".")
+    return engine if engine in ENGINES else "pytorch"
+
+
+def artifact_max_batch(weights):
+    # Largest batch the model at `weights` accepts; None when unbounded
+    return None if artifact_engine(weights) in DYNAMIC_BATCH_ENGINES else 1
+
+
+def _load_worker_model(weights, imgsz=DEFAULT_IMAGE_SIZE, threads=None):
+    # Imported here so the web app starts without paying for torch/ultralytics
+    import torch
+    from ultralytics import YOLO
+
+    if threads:
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+        torch.set_num_threads(threads)
+    model = YOLO(weights, task="detect")
+    _worker_state.model = model
+    _worker_state.imgsz = imgsz
+    _worker_state.class_ids = {name.lower(): idx for idx, name in model.names.items()}
+    # Reused letterbox buffers, grown on demand to the largest batch seen
+    _worker_state.pixels = np.empty((0, imgsz, imgsz, 3), dtype=np.uint8)
+    _worker_state.inputs = torch.empty((0, 3, imgsz, imgsz), dtype=torch.float32)
+
+
+def _warmup_worker(runs):
+    # The first forward passes allocate buffers and pick kernels; pay for
+    # that on dummy frames instead of on the first real request.
+    imgsz = _worker_state.imgsz
+    frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(runs):
+        _run_model([frame], [1.0], [detection_options()])
+
+
+def letterbox_into(frame, out, fill=LETTERBOX_FILL):
+    # Resize `frame` to fit the square `out` buffer keeping its aspect ratio,
+    # centre it and pad the rest, in a single warpAffine pass written straight
+    # into `out`. Returns (gain, pad_x, pad_y) to map boxes back.
+    size = out.shape[0]
+    height, width = frame.shape[:2]
+    gain = min(size / height, size / width)
+    pad_x = (size - width * gain) / 2
+    pad_y = (size - height * gain) / 2
+    matrix = np.array([[gain, 0, pad_x], [0, gain, pad_y]], dtype=np.float32)
+    cv2.warpAffine(
+        frame, matrix, (size, size), dst=out, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(fill, fill, fill),
+    )
+    cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+    return gain, pad_x, pad_y
+
+
+def _preprocess(frames):
+    # Letterbox every frame into the worker's reusable uint8 buffer, then
+    # convert into its reusable float input tensor (NCHW, RGB, 0-1).
+    import torch
+
+    count = len(frames)
+    if _worker_state.pixels.shape[0] < count:
+        imgsz = _worker_state.imgsz
+        _worker_state.pixels = np.empty((count, imgsz, imgsz, 3), dtype=np.uint8)
+        _worker_state.inputs = torch.empty((count, 3, imgsz, imgsz), dtype=torch.float32)
+
+    pixels = _worker_state.pixels
+    transforms = [letterbox_into(frame, pixels[i]) for i, frame in enumerate(frames)]
+    inputs = _worker_state.inputs[:count]
+    inputs.copy_(torch.from_numpy(pixels[:count]).permute(0, 3, 1, 2)).div_(255)
+    return inputs, transforms
+
+
+def detection_options(classes=None, confidence=CONFIDENCE_THRESHOLD, max_detections=DEFAULT_MAX_DETECTIONS):
+    # Plain dict so options pickle cheaply into process workers
+    return {"classes": classes, "confidence": confidence, "max_detections": max_detections}
+
+
+def _merge_options(class_ids, options):
+    # One forward pass serves every request in the batch, so the model gets
+    # the loosest settings and each request is narrowed down afterwards.
+    if any(ids is None for ids in class_ids):
+        classes = None
+    else:
+        classes = sorted(set().union(*class_ids))
+    confidence = min(o["confidence"] for o in options)
+    max_detections = max(o["max_detections"] for o in options)
+    # A reduced limit is only safe when every request filters the same way;
+    # otherwise one request's low-confidence or other-class boxes could use
+    # up another's slots. extract_detections applies each request's limit.
+    filters = {(None if ids is None else frozenset(ids), o["confidence"]) for ids, o in zip(class_ids, options)}
+    if len(filters) > 1:
+        max_detections = max(max_detections, DEFAULT_MAX_DETECTIONS)
+    return classes, confidence, max_detections
+
+
+def _run_model(frames, scales, options):
+    # Returns (detections per frame, seconds per stage). Timings travel back
+    # with the results because process workers cannot record metrics.
+    model = _worker_state.model
+    class_ids = [
+        None if o["classes"] is None
+        else [_worker_state.class_ids[c.lower()] for c in o["classes"] if c.lower() in _worker_state.class_ids]
+        for o in options
+    ]
+    classes, confidence, max_detections = _merge_options(class_ids, options)
+    if classes == []:
+        # None of the requested labels exist in this model
+        return [[] for _ in frames], {}
+
+    started = time.perf_counter()
+    inputs, transforms = _preprocess(frames)
+    preprocessed = time.perf_counter()
+    results = model(
+        inputs,
+        classes=classes,
+        conf=confidence,
+        max_det=max_detections,
+        verbose=False,
+    )
+    inferred = time.perf_counter()
+    detections = [
+        extract_detections(
+            result, ids, o["confidence"], o["max_detections"],
+            transform=(*transform, scale, frame.shape[1] * scale, frame.shape[0] * scale),
+        )
+        for result, ids, o, transform, frame, scale in zip(results, class_ids, options, transforms, frames, scales)
+    ]
+    finished = time.perf_counter()
+
+    # ultralytics reports per-image ms for the forward pass and NMS
+    forward = sum(result.speed["inference"] for result in results) / 1000
+    nms = sum(result.speed["postprocess"] for result in results) / 1000
+    timings = {
+        "preprocess": preprocessed - started,
+        "forward": forward,
+        "nms": nms,
+        "postprocess": finished - inferred,
+    }
+    return detections, timings
+
+
+def extract_detections(result, class_ids=None, confidence=CONFIDENCE_THRESHOLD, max_detections=None, transform=None):
+    # Work on the whole (N, 6) [x1, y1, x2, y2, conf, cls] array at once;
+    # rows come out of NMS sorted by confidence. `transform` is
+    # (gain, pad_x, pad_y, scale, width, height) mapping letterboxed model
+    # coordinates back onto the original width x height image.
+    data = result.boxes.data.cpu().numpy()
+    keep = data[:, -2] >= confidence
+    if class_ids is not None:
+        keep &= np.isin(data[:, -1].astype(int), class_ids)
+    data = data[keep][:max_detections]
+
+    xyxy = data[:, :4]
+    if transform is not None:
+        gain, pad_x, pad_y, scale, width, height = transform
+        xyxy = (xyxy - [pad_x, pad_y, pad_x, pad_y]) * (scale / gain)
+        xyxy = np.clip(xyxy, 0, [width, height, width, height])
+
+    names = result.names
+    labels = [names[c] for c in data[:, -1].astype(int).tolist()]
+    confidences = data[:, -2].tolist()
+    boxes = xyxy.astype(int).tolist()
+    return [
+        {"label": label, "confidence": conf, "box": box}
+        for label, conf, box in zip(labels, confidences, boxes)
+    ]
+
+
+class LocalDetector:
+    # The server's preprocessing, model and post-processing run directly in
+    # the calling thread, for offline jobs that batch frames themselves.
+    # Use it from the thread that created it (the model is thread-local).
+
+    def __init__(self, weights, imgsz=DEFAULT_IMAGE_SIZE, threads=None):
+        _load_worker_model(weights, imgsz, threads)
+
+    def warmup(self, runs=1):
+        _warmup_worker(runs)
+
+    def detect(self, frames, scales, options):
+        # Returns (detections per frame, seconds per stage)
+        return _run_model(frames, scales, [options] * len(frames))
+
+
+class ExecutorBackend:
+    # Runs decoding on a small thread pool and inference on a pool of
+    # workers that each hold their own preloaded model. At most
+    # max_decode_queue payloads are decoding or waiting to; more are
+    # rejected before their frames are ever allocated. max_batch caps the
+    # frames per infer() call (None for no limit).
+
+    def __init__(self, executor, workers, decode_workers=2, max_decode_queue=32, max_batch=None):
+        self.workers = workers
+        self.max_decode_queue = max_decode_queue
+        self.max_batch = max_batch
+        self._executor = executor
+        self._decode_executor = ThreadPoolExecutor(
+            max_workers=decode_workers, thread_name_prefix="decode"
+        )
+        self._decoding = 0
+
+    async def decode(self, fn, *args):
+        if self._decoding >= self.max_decode_queue:
+            raise InferenceOverloaded("Decode queue is full")
+        self._decoding += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._decode_executor, fn, *args)
+        finally:
+            self._decoding -= 1
+
+    async def warmup(self, runs=1):
+        # One task per worker, so every worker loads its model (via the pool
+        # initializer) and runs its warmup passes before traffic arrives
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, _warmup_worker, runs)
+            for _ in range(self.workers)
+        ))
+
+    async def infer(self, frames, scales, options):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, _run_model, frames, scales, options)
+
+    def shutdown(self):
+        self._decode_executor.shutdown(wait=False, cancel_futures=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_backend(kind, weights, workers=1, decode_workers=2, imgsz=DEFAULT_IMAGE_SIZE, threads=None,
+                   max_decode_queue=32):
+    # `weights` may be a .pt file or any artifact returned by export_model.
+    # `threads` caps intra-op threads per worker.
+    initargs = (weights, imgsz, threads)
+    if kind == "thread":
+        executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="inference",
+            initializer=_load_worker_model,
+            initargs=initargs,
+        )
+    elif kind == "process":
+        # Spawned (not forked) so each worker starts with a clean torch runtime
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_worker_model,
+            initargs=initargs,
+        )
+    else:
+        raise ValueError(f"Unknown inference backend: {kind}")
+    return ExecutorBackend(executor, workers, decode_workers, max_decode_queue, artifact_max_batch(weights))
+
+
+class InferenceBatcher:
+    # Collects concurrent /detect frames and runs them through the backend
+    # in a single forward pass, with at most one batch in flight per worker.
+    # Submissions are rejected once max_queue frames are already waiting.
+
+    def __init__(self, backend, max_batch_size=8, max_wait=0.01, max_queue=64):
+        self.backend = backend
+        # Artifacts traced for a fixed batch size cap micro-batches
+        self.max_batch_size = min(max_batch_size, backend.max_batch or max_batch_size)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = None
+        self._worker = None
+        self._batches = set()
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._batches):
+            task.cancel()
+        pending = []
+        while self._queue and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._fail(pending, RuntimeError("Inference queue is shutting down"))
+        self.backend.shutdown()
+
+    @staticmethod
+    def _fail(batch, error):
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    async def submit(self, frame, options=None, scale=1.0):
+        if self._worker is None:
+            raise RuntimeError("Inference queue is not running")
+        future = asyncio.get_running_loop().create_future()
+        request = _Request(frame, scale, options or detection_options(), future, time.perf_counter())
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            raise InferenceOverloaded("Inference queue is full")
+        return await future
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.backend.workers)
+        while True:
+            # Wait for a free worker first so frames keep piling into the
+            # next batch while every worker is busy.
+            await slots.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _dispatch(self, batch):
+        started = time.perf_counter()
+        batch_size_histogram.observe(len(batch))
+        for request in batch:
+            queue_wait_histogram.observe(started - request.enqueued)
+
+        frames = [request.frame for request in batch]
+        scales = [request.scale for request in batch]
+        options = [request.options for request in batch]
+        try:
+            results, timings = await self.backend.infer(frames, scales, options)
+        except asyncio.CancelledError:
+            self._fail(batch, RuntimeError("Inference queue is shutting down"))
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        for stage, seconds in timings.items():
+            stage_histogram.labels(stage=stage).observe(seconds)
+
+        for request, detections in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result(detections)
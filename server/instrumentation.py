@@ -0,0 +1,215 @@
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+from pymongo import common, monitoring
+from starlette.routing import Match
+
+from metrics import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+request_latency_histogram = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    buckets=LATENCY_BUCKETS,
+    labelnames=("method", "route", "status"),
+)
+requests_in_flight_gauge = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+    labelnames=("method", "route"),
+)
+mongo_command_histogram = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command round-trip time by collection and operation",
+    buckets=LATENCY_BUCKETS,
+    labelnames=("collection", "operation", "outcome"),
+)
+
+mongo_pool_connections_gauge = Gauge(
+    "mongo_pool_connections",
+    "Driver connections per server by state (open, checked_out)",
+    labelnames=("address", "state"),
+)
+mongo_pool_max_size_gauge = Gauge(
+    "mongo_pool_max_size",
+    "Configured maxPoolSize per server",
+    labelnames=("address",),
+)
+mongo_pool_waiting_gauge = Gauge(
+    "mongo_pool_wait_queue",
+    "Operations currently waiting to check out a connection",
+    labelnames=("address",),
+)
+mongo_pool_checkout_histogram = Histogram(
+    "mongo_pool_checkout_seconds",
+    "Time spent waiting for a pooled connection",
+    buckets=LATENCY_BUCKETS,
+    labelnames=("address",),
+)
+mongo_pool_checkout_failures_counter = Counter(
+    "mongo_pool_checkout_failures_total",
+    "Connection checkouts that failed, by reason (e.g. timeout)",
+    labelnames=("address", "reason"),
+)
+
+
+def route_template(app, scope):
+    # Label by route template ("/rooms/{room_id}"), never by raw path, so
+    # metric cardinality stays bounded
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def request_metrics_middleware(app):
+    async def record_request_metrics(request, call_next):
+        method = request.method
+        route = route_template(app, request.scope)
+        in_flight = requests_in_flight_gauge.labels(method=method, route=route)
+        in_flight.inc()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            in_flight.dec()
+            request_latency_histogram.labels(method=method, route=route, status=status).observe(
+                time.perf_counter() - started
+            )
+
+    return record_request_metrics
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    # Times every command the driver sends, keyed by the collection it
+    # targets (e.g. find on "rooms", insert on "users")
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        # getMore carries the cursor id under its name and the collection
+        # under "collection"
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), "-")
+        mongo_command_histogram.labels(
+            collection=collection, operation=event.command_name, outcome=outcome
+        ).observe(event.duration_micros / 1_000_000)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+def _address(event):
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    # Tracks pool utilization (open vs checked-out connections against
+    # maxPoolSize) and the wait queue in front of it. A wait queue that
+    # stays non-empty means maxPoolSize is too small for the load.
+
+    def __init__(self, max_pool_size=common.MAX_POOL_SIZE):
+        # event.options only lists non-default options, so the configured
+        # size is the fallback when maxPoolSize is left at the default
+        self.max_pool_size = max_pool_size
+
+    def pool_created(self, event):
+        max_pool_size = event.options.get("maxPoolSize", self.max_pool_size)
+        mongo_pool_max_size_gauge.labels(address=_address(event)).set(max_pool_size)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections_gauge.labels(address=_address(event), state="open").inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections_gauge.labels(address=_address(event), state="open").dec()
+
+    def connection_check_out_started(self, event):
+        mongo_pool_waiting_gauge.labels(address=_address(event)).inc()
+
+    def connection_check_out_failed(self, event):
+        address = _address(event)
+        mongo_pool_waiting_gauge.labels(address=address).dec()
+        mongo_pool_checkout_failures_counter.labels(address=address, reason=event.reason).inc()
+
+    def connection_checked_out(self, event):
+        address = _address(event)
+        mongo_pool_waiting_gauge.labels(address=address).dec()
+        mongo_pool_connections_gauge.labels(address=address, state="checked_out").inc()
+        if event.duration is not None:
+            mongo_pool_checkout_histogram.labels(address=address).observe(event.duration)
+
+    def connection_checked_in(self, event):
+        mongo_pool_connections_gauge.labels(address=_address(event), state="checked_out").dec()
+
+
+class SamplingProfiler:
+    # Samples every thread's Python stack at a fixed interval and returns
+    # the result in folded-stack format ("a;b;c 42" per line), which
+    # flamegraph.pl and speedscope render as flame graphs. Stacks from
+    # process-pool workers are not visible from here.
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def profile(self, seconds):
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            return self._sample(seconds)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds):
+        own_thread = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = StackCounter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,450 @@
+from collections import defaultdict
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# Backs the barcode lookup in the "embedded" storage mode (multikey, not
+# unique: rooms stored before this index may already share codes)
+ROOM_INVENTORY_INDEXES = [
+    IndexModel([("inventory.qrCode", ASCENDING)], name="inventory_qrCode"),
+]
+
+# Indexes backing the "collection" storage mode. (roomId, id) makes
+# single-item reads and duplicate checks index lookups; (roomId, _id)
+# returns a room's items in insertion order without an in-memory sort.
+ITEM_INDEXES = [
+    IndexModel([("roomId", ASCENDING), ("id", ASCENDING)], unique=True, name="roomId_id"),
+    IndexModel([("roomId", ASCENDING), ("_id", ASCENDING)], name="roomId__id"),
+    IndexModel(
+        [("qrCode", ASCENDING)],
+        unique=True,
+        # Items without a code may share the empty string
+        partialFilterExpression={"qrCode": {"$gt": ""}},
+        name="qrCode",
+    ),
+]
+MISSED_ITEM_INDEXES = [
+    IndexModel([("roomId", ASCENDING), ("_id", ASCENDING)], name="roomId__id"),
+]
+
+ITEM_PROJECTION = {"_id": 0, "roomId": 0}
+
+# Per-item outcomes of a bulk insert
+ADDED = {"status": "added"}
+SKIPPED = {"status": "skipped", "error": "Not attempted after an earlier failure"}
+ID_EXISTS = "Item with this ID already exists in inventory"
+QR_CODE_EXISTS = "Item with this QR code already exists"
+
+
+class RoomNotFound(Exception):
+    pass
+
+
+class ItemNotFound(Exception):
+    pass
+
+
+class DuplicateItem(Exception):
+    pass
+
+
+class EmbeddedInventoryStore:
+    # Items live in the room document's inventory / missedItems arrays
+
+    def __init__(self, db):
+        self.rooms = db["rooms"]
+
+    def index_specs(self):
+        return [(self.rooms, ROOM_INVENTORY_INDEXES)]
+
+    def hot_queries(self):
+        return [
+            (self.rooms, {"id": "", "inventory.id": ""}),
+            (self.rooms, {"inventory.qrCode": ""}),
+        ]
+
+    async def _room_exists(self, room_id):
+        return await self.rooms.find_one({"id": room_id}, {"_id": 1}) is not None
+
+    async def _raise_missing(self, room_id, item_id):
+        if not await self._room_exists(room_id):
+            raise RoomNotFound(room_id)
+        raise ItemNotFound(item_id)
+
+    async def attach(self, room):
+        return room
+
+    async def attach_many(self, rooms):
+        return rooms
+
+    async def insert_room(self, room):
+        await self.rooms.insert_one(room)
+
+    async def replace_room(self, room_id, room):
+        result = await self.rooms.replace_one({"id": room_id}, room)
+        return result.matched_count > 0
+
+    async def delete_room(self, room_id):
+        result = await self.rooms.delete_one({"id": room_id})
+        return result.deleted_count > 0
+
+    async def update_room(self, room_id, fields):
+        # Room-level fields only; items have their own targeted updates
+        result = await self.rooms.update_one({"id": room_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    async def record_audit(self, room_id, missed_items, checked_time):
+        # An audit's outcome: the missed list and check time in one update
+        result = await self.rooms.update_one(
+            {"id": room_id},
+            {"$set": {"missedItems": missed_items, "lastCheckedTime": checked_time}}
+        )
+        return result.matched_count > 0
+
+    async def list_items(self, room_id):
+        room = await self.rooms.find_one({"id": room_id}, {"_id": 0, "inventory": 1})
+        if not room:
+            raise RoomNotFound(room_id)
+        return room.get("inventory", [])
+
+    async def get_item(self, room_id, item_id):
+        # Positional projection sends back only the matching array element
+        room = await self.rooms.find_one(
+            {"id": room_id, "inventory.id": item_id},
+            {"_id": 0, "inventory.$": 1}
+        )
+        if room:
+            return room["inventory"][0]
+        await self._raise_missing(room_id, item_id)
+
+    async def update_item(self, room_id, item_id, fields):
+        # Positional $set touches only the matched element
+        result = await self.rooms.update_one(
+            {"id": room_id, "inventory.id": item_id},
+            {"$set": {f"inventory.$.{field}": value for field, value in fields.items()}}
+        )
+        if not result.matched_count:
+            await self._raise_missing(room_id, item_id)
+
+    async def remove_item(self, room_id, item_id):
+        result = await self.rooms.update_one(
+            {"id": room_id, "inventory.id": item_id},
+            {"$pull": {"inventory": {"id": item_id}}}
+        )
+        if not result.matched_count:
+            await self._raise_missing(room_id, item_id)
+
+    async def remove_missed(self, room_id, item_id):
+        result = await self.rooms.update_one(
+            {"id": room_id, "missedItems.id": item_id},
+            {"$pull": {"missedItems": {"id": item_id}}}
+        )
+        if not result.matched_count:
+            await self._raise_missing(room_id, item_id)
+
+    async def add_item(self, room_id, item):
+        # Duplicate check and push in one atomic update
+        result = await self.rooms.update_one(
+            {"id": room_id, "inventory.id": {"$ne": item["id"]}},
+            {"$push": {"inventory": item}}
+        )
+        if result.matched_count:
+            return
+        if not await self._room_exists(room_id):
+            raise RoomNotFound(room_id)
+        raise DuplicateItem(ID_EXISTS)
+
+    async def add_items(self, room_id, items, ordered=True):
+        # Duplicates are filtered against the room's current ids, then all
+        # new items go in with one $push/$each. The $nin guard makes that
+        # push fail instead of duplicating an id added concurrently, in
+        # which case the ids are re-read and the chunk re-checked.
+        while True:
+            room = await self.rooms.find_one({"id": room_id}, {"_id": 0, "inventory.id": 1})
+            if not room:
+                raise RoomNotFound(room_id)
+            existing = {item["id"] for item in room.get("inventory", [])}
+            results = []
+            accepted = []
+            stopped = False
+            for item in items:
+                if stopped:
+                    results.append(SKIPPED)
+                elif item["id"] in existing:
+                    results.append({"status": "duplicate", "error": ID_EXISTS})
+                    stopped = ordered
+                else:
+                    existing.add(item["id"])
+                    accepted.append(item)
+                    results.append(ADDED)
+            if not accepted:
+                return results
+            result = await self.rooms.update_one(
+                {"id": room_id, "inventory.id": {"$nin": [item["id"] for item in accepted]}},
+                {"$push": {"inventory": {"$each": accepted}}}
+            )
+            if result.matched_count:
+                return results
+
+    async def find_rooms_by_barcodes(self, barcodes):
+        # One $in query for the whole batch; maps each barcode to its room
+        found = {}
+        cursor = self.rooms.find(
+            {"inventory.qrCode": {"$in": barcodes}},
+            {"_id": 0, "id": 1, "name": 1, "inventory.qrCode": 1}
+        )
+        wanted = set(barcodes)
+        async for room in cursor:
+            for item in room.pop("inventory", []):
+                if item.get("qrCode") in wanted:
+                    found.setdefault(item["qrCode"], room)
+        return found
+
+    async def add_missed(self, room_id, item):
+        result = await self.rooms.update_one({"id": room_id}, {"$push": {"missedItems": item}})
+        return result.matched_count > 0
+
+    async def clear_missed(self, room_id):
+        result = await self.rooms.update_one({"id": room_id}, {"$set": {"missedItems": []}})
+        return result.matched_count > 0
+
+    async def find_room_by_barcode(self, barcode):
+        return await self.rooms.find_one(
+            {"inventory.qrCode": barcode},
+            {"_id": 0, "id": 1, "name": 1}
+        )
+
+
+class CollectionInventoryStore(EmbeddedInventoryStore):
+    # One document per item in the items / missed_items collections, keyed
+    # by (roomId, id). Room documents keep only their own fields and the
+    # arrays are filled in when a whole room is returned to the client.
+
+    def __init__(self, db):
+        super().__init__(db)
+        self.items = db["items"]
+        self.missed = db["missed_items"]
+
+    def index_specs(self):
+        return [(self.items, ITEM_INDEXES), (self.missed, MISSED_ITEM_INDEXES)]
+
+    def hot_queries(self):
+        return [
+            (self.items, {"roomId": "", "id": ""}),
+            (self.items, {"qrCode": ""}),
+            (self.missed, {"roomId": ""}),
+        ]
+
+    @staticmethod
+    def _documents(room_id, items):
+        return [{**item, "roomId": room_id} for item in items]
+
+    @staticmethod
+    def _key_message(details):
+        if "qrCode" in (details.get("keyPattern") or {}):
+            return QR_CODE_EXISTS
+        return ID_EXISTS
+
+    @classmethod
+    def _duplicate_message(cls, error):
+        details = getattr(error, "details", None) or {}
+        if isinstance(error, BulkWriteError):
+            details = (details.get("writeErrors") or [{}])[0]
+        return cls._key_message(details)
+
+    async def _list(self, collection, room_id):
+        return await collection.find({"roomId": room_id}, ITEM_PROJECTION).sort("_id", ASCENDING).to_list(None)
+
+    async def attach(self, room):
+        room["inventory"] = await self._list(self.items, room["id"])
+        room["missedItems"] = await self._list(self.missed, room["id"])
+        return room
+
+    async def attach_many(self, rooms):
+        room_ids = [room["id"] for room in rooms]
+        for collection, field in ((self.items, "inventory"), (self.missed, "missedItems")):
+            grouped = defaultdict(list)
+            cursor = collection.find({"roomId": {"$in": room_ids}}, {"_id": 0}).sort("_id", ASCENDING)
+            async for item in cursor:
+                grouped[item.pop("roomId")].append(item)
+            for room in rooms:
+                room[field] = grouped.get(room["id"], [])
+        return rooms
+
+    async def _insert_items(self, room_id, items):
+        # Callers undo a partial insert themselves; a blanket delete here
+        # would also take out items the room held before
+        try:
+            if items["inventory"]:
+                await self.items.insert_many(self._documents(room_id, items["inventory"]))
+            if items["missedItems"]:
+                await self.missed.insert_many(self._documents(room_id, items["missedItems"]))
+        except BulkWriteError as e:
+            raise DuplicateItem(self._duplicate_message(e))
+
+    async def _remove_items(self, room_id):
+        await self.items.delete_many({"roomId": room_id})
+        await self.missed.delete_many({"roomId": room_id})
+
+    async def insert_room(self, room):
+        room = dict(room)
+        items = {"inventory": room.pop("inventory", []), "missedItems": room.pop("missedItems", [])}
+        await self.rooms.insert_one(room)
+        try:
+            await self._insert_items(room["id"], items)
+        except DuplicateItem:
+            await self._remove_items(room["id"])
+            await self.rooms.delete_one({"id": room["id"]})
+            raise
+
+    async def _check_replacement(self, room_id, inventory):
+        # The checks the unique indexes would make, against everything but
+        # the room's own current items (the replacement removes those)
+        ids = [item["id"] for item in inventory]
+        if len(set(ids)) != len(ids):
+            raise DuplicateItem(ID_EXISTS)
+        codes = [item["qrCode"] for item in inventory if item.get("qrCode")]
+        if len(set(codes)) != len(codes):
+            raise DuplicateItem(QR_CODE_EXISTS)
+        if codes and await self.items.find_one({"qrCode": {"$in": codes}, "roomId": {"$ne": room_id}}, {"_id": 1}):
+            raise DuplicateItem(QR_CODE_EXISTS)
+
+    async def replace_room(self, room_id, room):
+        # Without a transaction: validate first, then swap, and put the old
+        # room back if an insert still loses a race for a QR code. The body
+        # may rename the room, so the new items go under room["id"].
+        room = dict(room)
+        new_id = room["id"]
+        items = {"inventory": room.pop("inventory", []), "missedItems": room.pop("missedItems", [])}
+        old_room = await self.rooms.find_one({"id": room_id})
+        if old_room is None:
+            return False
+        await self._check_replacement(room_id, items["inventory"])
+        old_items = {
+            "inventory": await self._list(self.items, room_id),
+            "missedItems": await self._list(self.missed, room_id),
+        }
+
+        await self.rooms.replace_one({"id": room_id}, room)
+        await self._remove_items(room_id)
+        try:
+            await self._insert_items(new_id, items)
+        except DuplicateItem:
+            await self._remove_items(new_id)
+            await self._remove_items(room_id)
+            await self._insert_items(room_id, old_items)
+            await self.rooms.replace_one({"_id": old_room["_id"]}, old_room)
+            raise
+        return True
+
+    async def delete_room(self, room_id):
+        if not await super().delete_room(room_id):
+            return False
+        await self.items.delete_many({"roomId": room_id})
+        await self.missed.delete_many({"roomId": room_id})
+        return True
+
+    async def list_items(self, room_id):
+        if not await self._room_exists(room_id):
+            raise RoomNotFound(room_id)
+        return await self._list(self.items, room_id)
+
+    async def get_item(self, room_id, item_id):
+        item = await self.items.find_one({"roomId": room_id, "id": item_id}, ITEM_PROJECTION)
+        if item:
+            return item
+        await self._raise_missing(room_id, item_id)
+
+    async def update_item(self, room_id, item_id, fields):
+        try:
+            result = await self.items.update_one({"roomId": room_id, "id": item_id}, {"$set": fields})
+        except DuplicateKeyError as e:
+            raise DuplicateItem(self._duplicate_message(e))
+        if not result.matched_count:
+            await self._raise_missing(room_id, item_id)
+
+    async def remove_item(self, room_id, item_id):
+        result = await self.items.delete_one({"roomId": room_id, "id": item_id})
+        if not result.deleted_count:
+            await self._raise_missing(room_id, item_id)
+
+    async def remove_missed(self, room_id, item_id):
+        result = await self.missed.delete_many({"roomId": room_id, "id": item_id})
+        if not result.deleted_count:
+            await self._raise_missing(room_id, item_id)
+
+    async def add_item(self, room_id, item):
+        if not await self._room_exists(room_id):
+            raise RoomNotFound(room_id)
+        try:
+            await self.items.insert_one({**item, "roomId": room_id})
+        except DuplicateKeyError as e:
+            raise DuplicateItem(self._duplicate_message(e))
+
+    async def add_items(self, room_id, items, ordered=True):
+        if not await self._room_exists(room_id):
+            raise RoomNotFound(room_id)
+        results = [ADDED] * len(items)
+        try:
+            await self.items.insert_many(self._documents(room_id, items), ordered=ordered)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            for error in errors:
+                if error["code"] == 11000:
+                    results[error["index"]] = {"status": "duplicate", "error": self._key_message(error)}
+                else:
+                    results[error["index"]] = {"status": "error", "error": error["errmsg"]}
+            if ordered:
+                # An ordered insert stops at its first failure
+                first = errors[0]["index"]
+                results[first + 1:] = [SKIPPED] * (len(items) - first - 1)
+        return results
+
+    async def find_rooms_by_barcodes(self, barcodes):
+        items = await self.items.find(
+            {"qrCode": {"$in": barcodes}},
+            {"_id": 0, "roomId": 1, "qrCode": 1}
+        ).to_list(None)
+        rooms = await self.rooms.find(
+            {"id": {"$in": list({item["roomId"] for item in items})}},
+            {"_id": 0, "id": 1, "name": 1}
+        ).to_list(None)
+        rooms_by_id = {room["id"]: room for room in rooms}
+        return {
+            item["qrCode"]: rooms_by_id[item["roomId"]]
+            for item in items if item["roomId"] in rooms_by_id
+        }
+
+    async def add_missed(self, room_id, item):
+        if not await self._room_exists(room_id):
+            return False
+        await self.missed.insert_one({**item, "roomId": room_id})
+        return True
+
+    async def clear_missed(self, room_id):
+        if not await self._room_exists(room_id):
+            return False
+        await self.missed.delete_many({"roomId": room_id})
+        return True
+
+    async def record_audit(self, room_id, missed_items, checked_time):
+        if not await self.update_room(room_id, {"lastCheckedTime": checked_time}):
+            return False
+        await self.missed.delete_many({"roomId": room_id})
+        if missed_items:
+            await self.missed.insert_many(self._documents(room_id, missed_items))
+        return True
+
+    async def find_room_by_barcode(self, barcode):
+        item = await self.items.find_one({"qrCode": barcode}, {"_id": 0, "roomId": 1})
+        if not item:
+            return None
+        return await self.rooms.find_one({"id": item["roomId"]}, {"_id": 0, "id": 1, "name": 1})
+
+
+def create_inventory_store(db, mode="embedded"):
+    if mode == "embedded":
+        return EmbeddedInventoryStore(db)
+    if mode == "collection":
+        return CollectionInventoryStore(db)
+    raise ValueError(f"Unknown inventory storage mode: {mode}")
@@ -1,16 +1,59 @@
 import os
-import cv2
-import base64
-import numpy as np
-from fastapi import FastAPI
-from ultralytics import YOLO 
+import json
+import asyncio
+import time
+import logging
+import uuid
+from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import Annotated
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
 from fastapi import Depends
-from models import Item, Room, ImageInput, LoginRequest, User
+from auth import MAX_PASSWORD_BYTES, PasswordHasher, TokenSigner
+from pydantic import ValidationError
+from models import AuditFinish, AuditStart, BarcodeBatch, Item, ItemPatch, Room, RoomPatch, RoomListQuery, DetectOptions, ImageInput, LoginRequest, User
+from inference import CONFIDENCE_THRESHOLD, InferenceBatcher, InferenceOverloaded, create_backend, export_model, decode_base64_image, decode_image, detection_options, stage_histogram
+from metrics import render_metrics
+from streaming import FrameSlot, contains_item
+from audit import AuditSessions
+from frame_cache import FrameCache, decode_and_hash
+from pymongo.errors import DuplicateKeyError
+from indexes import ensure_indexes, verify_indexes
+from inventory_store import SKIPPED, DuplicateItem, ItemNotFound, RoomNotFound, create_inventory_store
+from room_cache import RoomCache, create_cache_backend, etag_for
+from instrumentation import MongoCommandTimer, MongoPoolMonitor, SamplingProfiler, request_metrics_middleware
 from dotenv import load_dotenv
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The MongoDB client is created here, inside each server process, so
+    # every worker gets its own pool instead of one inherited across fork
+    connect_mongo()
+    # Build missing indexes, then check the hot queries actually use them
+    await ensure_indexes(db, inventory_store)
+    if MONGO_VERIFY_INDEXES:
+        await verify_indexes(db, inventory_store)
+    # Load and warm the detector before serving, or in the background when
+    # DETECT_BACKGROUND_LOAD is set (/readyz reports when it is done)
+    loading = asyncio.create_task(load_detector())
+    if not DETECT_BACKGROUND_LOAD:
+        await loading
+        if detector_status["state"] != "ready":
+            raise RuntimeError(f"Detector failed to load: {detector_status['error']}")
+    yield
+    loading.cancel()
+    if batcher:
+        await batcher.stop()
+    password_hasher.shutdown()
+    client.close()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost",
@@ -34,185 +77,872 @@ app.add_middleware(
     ],
 )
 
-# Load trained YOLO Model
-model = YOLO("./best.pt")  
+# Per-route latency histograms and in-flight gauges, served on /metrics
+app.middleware("http")(request_metrics_middleware(app))
 
-# MongoDB connection URI (replace with your actual URI)
 load_dotenv()
+
+# Trained YOLO model, optionally exported to an optimized CPU runtime
+# (DETECT_ENGINE=onnx|openvino|torchscript), then preloaded and warmed up
+# once per inference worker (thread or process) at startup
+DETECT_IMAGE_SIZE = int(os.getenv("DETECT_IMAGE_SIZE", "640"))
+DETECT_WARMUP_RUNS = int(os.getenv("DETECT_WARMUP_RUNS", "1"))
+DETECT_BACKGROUND_LOAD = os.getenv("DETECT_BACKGROUND_LOAD", "false").lower() == "true"
+
+# Near-duplicate frames (e.g. a stationary camera) reuse recent detections
+# instead of running the model again; DETECT_CACHE_SIZE=0 disables this
+DETECT_CACHE_SIZE = int(os.getenv("DETECT_CACHE_SIZE", "512"))
+frame_cache = FrameCache(
+    max_entries=DETECT_CACHE_SIZE,
+    ttl=float(os.getenv("DETECT_CACHE_TTL", "3")),
+    max_distance=int(os.getenv("DETECT_CACHE_DISTANCE", "3")),
+) if DETECT_CACHE_SIZE > 0 else None
+
+# Set once the detector is loaded and warmed up
+backend = None
+batcher = None
+detector_status = {"state": "loading", "error": None}
+
+async def load_detector():
+    global backend, batcher
+    try:
+        model_path = await asyncio.to_thread(
+            export_model,
+            "./best.pt",
+            os.getenv("DETECT_ENGINE", "pytorch"),
+            imgsz=DETECT_IMAGE_SIZE,
+            half=os.getenv("DETECT_HALF", "false").lower() == "true",
+            int8=os.getenv("DETECT_INT8", "false").lower() == "true",
+            data=os.getenv("DETECT_INT8_DATA"),
+        )
+        loaded = create_backend(
+            os.getenv("DETECT_BACKEND", "thread"),
+            model_path,
+            workers=int(os.getenv("DETECT_WORKERS", "1")),
+            decode_workers=int(os.getenv("DETECT_DECODE_WORKERS", "2")),
+            imgsz=DETECT_IMAGE_SIZE,
+            threads=int(os.getenv("DETECT_THREADS", "0")) or None,
+            max_decode_queue=int(os.getenv("DETECT_MAX_DECODE_QUEUE", "32")),
+        )
+        try:
+            await loaded.warmup(DETECT_WARMUP_RUNS)
+        except BaseException:
+            loaded.shutdown()
+            raise
+
+        # Micro-batching: concurrent /detect calls share one forward pass
+        batcher = InferenceBatcher(
+            loaded,
+            max_batch_size=int(os.getenv("DETECT_MAX_BATCH_SIZE", "8")),
+            max_wait=float(os.getenv("DETECT_MAX_WAIT_MS", "10")) / 1000,
+            max_queue=int(os.getenv("DETECT_MAX_QUEUE", "64")),
+        )
+        batcher.start()
+        backend = loaded
+        detector_status["state"] = "ready"
+    except Exception as e:
+        logger.exception("Failed to load detection model")
+        detector_status.update(state="failed", error=str(e))
+
+# MongoDB connection URI (replace with your actual URI)
 MONGO_URI = os.getenv("MONGO_URI")
-client = AsyncIOMotorClient(MONGO_URI)
-db = client["inventory"] 
 
-# Collection access shortcut
-rooms_collection = db["rooms"]
-users_collection = db["users"]
+# Connection pool and timeouts, per server process (with N uvicorn workers
+# the server sees up to N * MONGO_MAX_POOL_SIZE connections). timeoutMS
+# bounds each whole operation, retries included; 0 leaves it unbounded.
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    "maxConnecting": int(os.getenv("MONGO_MAX_CONNECTING", "2")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_MS", "300000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000")),
+}
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "0"))
+if MONGO_TIMEOUT_MS:
+    MONGO_CLIENT_OPTIONS["timeoutMS"] = MONGO_TIMEOUT_MS
+
+# Set by connect_mongo() at startup
+client = None
+db = None
+rooms_collection = None
+users_collection = None
+inventory_store = None
+
+def connect_mongo(mongo_client=None):
+    global client, db, rooms_collection, users_collection, inventory_store
+    client = mongo_client or AsyncIOMotorClient(
+        MONGO_URI,
+        event_listeners=[MongoCommandTimer(), MongoPoolMonitor(MONGO_CLIENT_OPTIONS["maxPoolSize"])],
+        **MONGO_CLIENT_OPTIONS,
+    )
+    db = client["inventory"]
 
-@app.post("/detect")
-async def detect_image(data: ImageInput):
-    try:
-        image_data = base64.b64decode(data.image_base64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    # Collection access shortcut
+    rooms_collection = db["rooms"]
+    users_collection = db["users"]
 
-        if frame is None:
-            raise HTTPException(status_code=400, detail="Invalid image")
+    # Inventory storage: "embedded" keeps items in the room document's arrays,
+    # "collection" keeps one indexed document per item (see migrate_inventory.py)
+    inventory_store = create_inventory_store(db, os.getenv("INVENTORY_STORAGE", "embedded"))
 
-        results = model(frame)
-        detections = []
+# Log any hot query that still plans a collection scan at startup
+MONGO_VERIFY_INDEXES = os.getenv("MONGO_VERIFY_INDEXES", "true").lower() == "true"
 
-        for result in results:
-            for box in result.boxes:
-                label = result.names[int(box.cls[0])]
-                confidence = float(box.conf[0])
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                if confidence >= 0.75:
-                    detections.append({
-                        "label": label,
-                        "confidence": confidence,
-                        "box": [x1, y1, x2, y2]
-                    })
+# Passwords are bcrypt-hashed off the event loop; login hands out signed
+# bearer tokens checked in memory. AUTH_REQUIRED=true makes the write
+# routes reject requests without a valid token.
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv("AUTH_BCRYPT_ROUNDS", "12")),
+    workers=int(os.getenv("AUTH_HASH_WORKERS", "2")),
+)
+token_signer = TokenSigner(os.getenv("AUTH_SECRET"), ttl=int(os.getenv("AUTH_TOKEN_TTL", str(12 * 3600))))
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "false").lower() == "true"
+
+def require_user(request: Request):
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    claims = token_signer.verify(token) if scheme.lower() == "bearer" and token else None
+    if claims is None:
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    return claims["sub"]
+
+# Database timeouts (server selection, wait queue, socket, timeoutMS) become
+# a 503 the client can retry instead of an unhandled 500
+@app.exception_handler(PyMongoError)
+async def mongo_error_handler(request: Request, exc: PyMongoError):
+    if exc.timeout:
+        return JSONResponse({"detail": "Database unavailable"}, status_code=503, headers={"Retry-After": "2"})
+    logger.error("MongoDB error on %s %s: %s", request.method, request.url.path, exc)
+    return JSONResponse({"detail": "Database error"}, status_code=500)
+
+def require_detector():
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Detection model is not ready", headers={"Retry-After": "5"})
+
+# Decode a frame and run it through the cache and model.
+# Returns None when the payload is not a decodable image.
+async def detect_frame(decode, payload, options, session_id=None):
+    if frame_cache is None:
+        frame, scale = await backend.decode(decode, payload, DETECT_IMAGE_SIZE)
+        return None if frame is None else await batcher.submit(frame, options, scale)
+
+    frame, scale, phash = await backend.decode(decode_and_hash, decode, payload, DETECT_IMAGE_SIZE)
+    if frame is None:
+        return None
+    classes = options["classes"]
+    namespace = (session_id, tuple(classes) if classes else None, options["confidence"], options["max_detections"])
+    detections = frame_cache.get(namespace, phash)
+    if detections is None:
+        detections = await batcher.submit(frame, options, scale)
+        frame_cache.put(namespace, phash, detections)
+    return detections
+
+async def run_detection(decode, payload, options: DetectOptions):
+    require_detector()
+    found_only = options.mode == "found"
+    try:
+        detections = await detect_frame(decode, payload, detection_options(
+            classes=options.classes,
+            confidence=options.confidence,
+            # A single hit is enough to answer {"found": ...}
+            max_detections=1 if found_only else options.max_detections,
+        ), options.session_id)
+
+        if detections is None:
+            raise HTTPException(status_code=400, detail="Invalid image")
 
-        return {"detections": detections}
+        # Render here rather than in FastAPI so serialization is timed too
+        started = time.perf_counter()
+        response = JSONResponse({"found": bool(detections)} if found_only else {"detections": detections})
+        stage_histogram.labels(stage="serialize").observe(time.perf_counter() - started)
+        return response
 
+    except InferenceOverloaded:
+        raise HTTPException(status_code=503, detail="Detection is busy, retry shortly", headers={"Retry-After": "1"})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# GET all rooms
+@app.post("/detect")
+async def detect_image(data: ImageInput):
+    return await run_detection(decode_base64_image, data.image_base64, data)
+
+# POST: Detect from a raw JPEG body (application/octet-stream, image/*)
+# or a multipart/form-data upload in the "image" field, without base64.
+# Detection options are passed as query parameters.
+async def read_image_payload(request: Request):
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing 'image' file field")
+        payload = await upload.read()
+    else:
+        payload = await request.body()
+
+    if not payload:
+        raise HTTPException(status_code=400, detail="Empty image body")
+    return payload
+
+@app.post("/detect/binary")
+async def detect_image_binary(request: Request, options: Annotated[DetectOptions, Query()]):
+    payload = await read_image_payload(request)
+    return await run_detection(decode_image, payload, options)
+
+# WebSocket: stream binary JPEG frames and receive detections per processed frame.
+# Text messages configure the session, e.g. {"itemName": "chair", "confidence": 0.8};
+# only that item is looked for, and once it is detected the server sends the
+# result and closes the socket. Frames that arrive while inference is busy
+# replace the pending one instead of queueing.
+# Checks a /ws/detect config message; returns (session updates, error)
+def parse_stream_config(config):
+    if not isinstance(config, dict):
+        return None, "Config must be a JSON object"
+    updates = {}
+    if "itemName" in config:
+        if config["itemName"] is not None and not isinstance(config["itemName"], str):
+            return None, "itemName must be a string"
+        updates["itemName"] = config["itemName"]
+    if "confidence" in config:
+        confidence = config["confidence"]
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+            return None, "confidence must be a number between 0 and 1"
+        updates["confidence"] = float(confidence)
+    return updates, None
+
+@app.websocket("/ws/detect")
+async def detect_stream(websocket: WebSocket):
+    await websocket.accept()
+    if batcher is None:
+        # 1013: try again later
+        await websocket.close(code=1013, reason="Detection model is not ready")
+        return
+    slot = FrameSlot()
+    session_id = uuid.uuid4().hex
+    session = {
+        "itemName": websocket.query_params.get("itemName"),
+        "confidence": CONFIDENCE_THRESHOLD,
+    }
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                slot.put(message["bytes"])
+            elif message.get("text"):
+                try:
+                    config = json.loads(message["text"])
+                except ValueError:
+                    await websocket.send_json({"error": "Invalid JSON message"})
+                    continue
+                updates, error = parse_stream_config(config)
+                if error:
+                    await websocket.send_json({"error": error})
+                    continue
+                session.update(updates)
+
+    async def process_frames():
+        while True:
+            payload = await slot.get()
+            try:
+                item_name = session["itemName"]
+                detections = await detect_frame(decode_image, payload, detection_options(
+                    classes=[item_name] if item_name else None,
+                    confidence=session["confidence"],
+                ), session_id)
+            except InferenceOverloaded:
+                await websocket.send_json({"error": "Detection is busy, frame dropped"})
+                continue
+            except Exception as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            if detections is None:
+                await websocket.send_json({"error": "Invalid image"})
+                continue
+
+            found = contains_item(detections, session["itemName"])
+            await websocket.send_json({"detections": detections, "found": found, "dropped": slot.dropped})
+            if found:
+                await websocket.close()
+                return
+
+    tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(process_frames())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Audit sessions: one pass over a room instead of one detection loop per
+# item. Start an audit, send frames (HTTP or WebSocket); every frame is
+# matched against the room's whole expected inventory and the running
+# found/missing lists come back. Finishing writes missedItems and
+# lastCheckedTime in a single update.
+audit_sessions = AuditSessions(
+    ttl=float(os.getenv("AUDIT_SESSION_TTL", "1800")),
+    max_sessions=int(os.getenv("AUDIT_MAX_SESSIONS", "256")),
+)
+
+def require_audit(audit_id):
+    session = audit_sessions.get(audit_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    return session
+
+async def audit_frame(session, payload):
+    # Returns None when the payload is not a decodable image
+    if session.complete:
+        return session.summary()
+    detections = await detect_frame(decode_image, payload, detection_options(
+        classes=session.labels,
+        confidence=session.confidence,
+    ), session.id)
+    if detections is None:
+        return None
+    session.observe(detections)
+    return session.summary()
+
+# POST: Start auditing a room against its current inventory
+@app.post("/rooms/{room_id}/audits", dependencies=[Depends(require_user)])
+async def start_audit(room_id: str, options: AuditStart = AuditStart()):
+    try:
+        inventory = await inventory_store.list_items(room_id)
+    except RoomNotFound:
+        raise HTTPException(status_code=404, detail="Room not found")
+    session = audit_sessions.start(room_id, inventory, options.confidence)
+    return session.summary()
+
+# GET: Current found/missing state of an audit
+@app.get("/audits/{audit_id}")
+async def get_audit(audit_id: str):
+    return require_audit(audit_id).summary()
+
+# POST: Match one frame (raw image body or multipart "image" field)
+@app.post("/audits/{audit_id}/frames")
+async def post_audit_frame(audit_id: str, request: Request):
+    session = require_audit(audit_id)
+    require_detector()
+    payload = await read_image_payload(request)
+    try:
+        summary = await audit_frame(session, payload)
+    except InferenceOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if summary is None:
+        raise HTTPException(status_code=400, detail="Invalid image")
+    return summary
+
+# POST: Finish the audit; whatever was not seen is recorded as missed
+@app.post("/audits/{audit_id}/finish", dependencies=[Depends(require_user)])
+async def finish_audit(audit_id: str, options: AuditFinish = AuditFinish()):
+    session = require_audit(audit_id)
+    checked_time = options.lastCheckedTime or datetime.now().strftime("%Y-%m-%d %H:%M")
+    if not await inventory_store.record_audit(session.room_id, session.missing_items(), checked_time):
+        raise HTTPException(status_code=404, detail="Room not found")
+    audit_sessions.finish(audit_id)
+    await invalidate_room(session.room_id)
+    return {**session.summary(), "lastCheckedTime": checked_time}
+
+# DELETE: Abandon an audit without recording anything
+@app.delete("/audits/{audit_id}", dependencies=[Depends(require_user)])
+async def cancel_audit(audit_id: str):
+    if not audit_sessions.finish(audit_id):
+        raise HTTPException(status_code=404, detail="Audit not found")
+    return {"message": "Audit cancelled"}
+
+# WebSocket: stream binary frames for an audit and receive the running
+# summary after each processed frame. Frames that arrive while inference is
+# busy replace the pending one. The socket closes once everything is found;
+# the audit still has to be finished with POST /audits/{audit_id}/finish.
+@app.websocket("/ws/audits/{audit_id}")
+async def audit_stream(websocket: WebSocket, audit_id: str):
+    await websocket.accept()
+    session = audit_sessions.get(audit_id)
+    if session is None:
+        await websocket.close(code=1008, reason="Audit not found")
+        return
+    if batcher is None:
+        await websocket.close(code=1013, reason="Detection model is not ready")
+        return
+    slot = FrameSlot()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                slot.put(message["bytes"])
+
+    async def process_frames():
+        while True:
+            payload = await slot.get()
+            try:
+                summary = await audit_frame(session, payload)
+            except InferenceOverloaded:
+                await websocket.send_json({"error": "Detection is busy, frame dropped"})
+                continue
+            except Exception as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            if summary is None:
+                await websocket.send_json({"error": "Invalid image"})
+                continue
+            await websocket.send_json({**summary, "dropped": slot.dropped})
+            if summary["complete"]:
+                await websocket.close()
+                return
+
+    tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(process_frames())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Liveness: the process is up and serving requests
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: the detection model is loaded and warmed up
+@app.get("/readyz")
+async def readyz():
+    if detector_status["state"] != "ready":
+        return JSONResponse(status_code=503, content={"status": detector_status["state"], "error": detector_status["error"]})
+    return {"status": "ready"}
+
+# Prometheus metrics: request latency, detection stages, batching, cache, MongoDB
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Sampling profiler (ENABLE_PROFILER=true): samples every thread for
+# `seconds` and returns folded stacks for flamegraph.pl / speedscope
+profiler = SamplingProfiler() if os.getenv("ENABLE_PROFILER", "false").lower() == "true" else None
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def get_profile(seconds: float = Query(10, gt=0, le=120)):
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    try:
+        folded = await asyncio.to_thread(profiler.profile, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(folded)
+
+# Rooms are read from the cursor and serialized in batches of this size,
+# so listing memory stays flat however many rooms there are
+ROOM_STREAM_BATCH = 100
+ROOM_SUMMARY_PROJECTION = {"_id": 0, "inventory": 0, "missedItems": 0}
+
+async def iter_rooms(params: RoomListQuery):
+    query = {"id": {"$gt": params.after}} if params.after is not None else {}
+    summary = params.view == "summary"
+    cursor = rooms_collection.find(query, ROOM_SUMMARY_PROJECTION if summary else {"_id": 0})
+    if params.limit is not None or params.after is not None:
+        # Paginated listings walk the unique rooms.id index
+        cursor = cursor.sort("id", 1)
+    if params.limit is not None:
+        cursor = cursor.limit(params.limit)
+    cursor = cursor.batch_size(ROOM_STREAM_BATCH)
+
+    batch = []
+    async for room in cursor:
+        batch.append(room)
+        if len(batch) == ROOM_STREAM_BATCH:
+            yield batch if summary else await inventory_store.attach_many(batch)
+            batch = []
+    if batch:
+        yield batch if summary else await inventory_store.attach_many(batch)
+
+async def stream_rooms_json(params: RoomListQuery):
+    yield "["
+    first = True
+    async for batch in iter_rooms(params):
+        for room in batch:
+            yield ("" if first else ",") + json.dumps(room)
+            first = False
+    yield "]"
+
+async def stream_rooms_ndjson(params: RoomListQuery):
+    async for batch in iter_rooms(params):
+        yield "".join(json.dumps(room) + "\n" for room in batch)
+
+# GET all rooms, streamed as a JSON array or NDJSON
+# (?format=ndjson or Accept: application/x-ndjson)
 @app.get("/rooms")
-async def get_rooms():
-    rooms = await rooms_collection.find({}, {"_id": 0}).to_list(1000)
-    return rooms
+async def get_rooms(request: Request, params: Annotated[RoomListQuery, Query()]):
+    if params.format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(stream_rooms_ndjson(params), media_type="application/x-ndjson")
+    return StreamingResponse(stream_rooms_json(params), media_type="application/json")
+
+# Read-through cache for single-room reads, invalidated by every write to
+# the room (ROOM_CACHE_TTL=0 disables it). ROOM_CACHE_URL=redis://... shares
+# it between server processes instead of keeping it in memory.
+ROOM_CACHE_TTL = float(os.getenv("ROOM_CACHE_TTL", "30"))
+room_cache = RoomCache(
+    create_cache_backend(os.getenv("ROOM_CACHE_URL"), int(os.getenv("ROOM_CACHE_SIZE", "1024"))),
+    ttl=ROOM_CACHE_TTL,
+) if ROOM_CACHE_TTL > 0 else None
+
+async def invalidate_room(room_id):
+    if room_cache is not None:
+        await room_cache.invalidate(room_id)
+
+# Serve load()'s payload through the cache with an ETag; a matching
+# If-None-Match gets an empty 304 instead of the body
+async def cached_response(request: Request, kind, room_id, load):
+    async def load_body():
+        return json.dumps(await load()).encode()
+
+    if room_cache is None:
+        body = await load_body()
+        etag = etag_for(body)
+    else:
+        body, etag = await room_cache.get_or_load(kind, room_id, load_body)
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
 # GET a single room by ID
 @app.get("/rooms/{room_id}")
-async def get_room(room_id: str):
-    room = await rooms_collection.find_one({"id": room_id}, {"_id": 0})
-    if not room:
-        return {"error": "Room not found"}
-    return room
+async def get_room(room_id: str, request: Request):
+    async def load():
+        room = await rooms_collection.find_one({"id": room_id}, {"_id": 0})
+        if not room:
+            return {"error": "Room not found"}
+        return await inventory_store.attach(room)
+
+    return await cached_response(request, "room", room_id, load)
 
 # POST: Add a new room
-@app.post("/rooms")
+@app.post("/rooms", dependencies=[Depends(require_user)])
 async def create_room(room: Room):
-    existing = await rooms_collection.find_one({"id": room.id})
-    if existing:
+    # The unique index on rooms.id rejects duplicates atomically
+    try:
+        await inventory_store.insert_room(room.dict())
+    except DuplicateKeyError:
         return {"error": f"Room with id '{room.id}' already exists"}
-    await rooms_collection.insert_one(room.dict())
+    except DuplicateItem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await invalidate_room(room.id)
     return {"message": "Room created"}
 
 # PUT: Replace entire room by ID
-@app.put("/rooms/{room_id}")
+@app.put("/rooms/{room_id}", dependencies=[Depends(require_user)])
 async def update_room(room_id: str, updated_data: Room):
-    result = await rooms_collection.replace_one({"id": room_id}, updated_data.dict())
-    if result.matched_count == 0:
+    try:
+        replaced = await inventory_store.replace_room(room_id, updated_data.dict())
+    except DuplicateItem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # The body may rename the room; drop anything cached under either id
+        await invalidate_room(room_id)
+        if updated_data.id != room_id:
+            await invalidate_room(updated_data.id)
+    if not replaced:
         return {"error": "Room not found"}
     return {"message": "Room updated"}
 
+def patch_fields(patch):
+    fields = patch.dict(exclude_unset=True, exclude_none=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    return fields
+
+# PATCH: Update room fields (e.g. lastCheckedTime after an audit) with $set,
+# leaving the inventory arrays untouched
+@app.patch("/rooms/{room_id}", dependencies=[Depends(require_user)])
+async def patch_room(room_id: str, patch: RoomPatch):
+    updated = await inventory_store.update_room(room_id, patch_fields(patch))
+    if not updated:
+        return {"error": "Room not found"}
+    await invalidate_room(room_id)
+    return {"message": "Room updated"}
+
 # DELETE: Delete room by ID
-@app.delete("/rooms/{room_id}")
+@app.delete("/rooms/{room_id}", dependencies=[Depends(require_user)])
 async def delete_room(room_id: str):
-    result = await rooms_collection.delete_one({"id": room_id})
-    if result.deleted_count == 0:
+    if not await inventory_store.delete_room(room_id):
         return {"error": "Room not found"}
+    await invalidate_room(room_id)
     return {"message": "Room deleted"}
 
 # GET: Get all inventory items in a room
 @app.get("/rooms/{room_id}/inventory")
-async def get_inventory(room_id: str):
-    room = await rooms_collection.find_one({"id": room_id}, {"_id": 0, "inventory": 1})
-    if not room:
+async def get_inventory(room_id: str, request: Request):
+    try:
+        return await cached_response(request, "inventory", room_id, lambda: inventory_store.list_items(room_id))
+    except RoomNotFound:
         raise HTTPException(status_code=404, detail="Room not found")
-    return room.get("inventory", [])
 
 # GET: Get a specific inventory item by ID
 @app.get("/rooms/{room_id}/inventory/{item_id}")
 async def get_inventory_item(room_id: str, item_id: str):
-    room = await rooms_collection.find_one({"id": room_id}, {"_id": 0})
-    if not room:
+    try:
+        return await inventory_store.get_item(room_id, item_id)
+    except RoomNotFound:
         raise HTTPException(status_code=404, detail="Room not found")
-    for item in room.get("inventory", []):
-        if item["id"] == item_id:
-            return item
-    raise HTTPException(status_code=404, detail="Item not found")
+    except ItemNotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+
 
+# PATCH: Update a single inventory item in place
+@app.patch("/rooms/{room_id}/inventory/{item_id}", dependencies=[Depends(require_user)])
+async def patch_inventory_item(room_id: str, item_id: str, patch: ItemPatch):
+    try:
+        await inventory_store.update_item(room_id, item_id, patch_fields(patch))
+    except RoomNotFound:
+        raise HTTPException(status_code=404, detail="Room not found")
+    except ItemNotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+    except DuplicateItem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await invalidate_room(room_id)
+    return {"message": "Inventory item updated"}
+
+# DELETE: Remove a single inventory item
+@app.delete("/rooms/{room_id}/inventory/{item_id}", dependencies=[Depends(require_user)])
+async def delete_inventory_item(room_id: str, item_id: str):
+    try:
+        await inventory_store.remove_item(room_id, item_id)
+    except RoomNotFound:
+        raise HTTPException(status_code=404, detail="Room not found")
+    except ItemNotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+    await invalidate_room(room_id)
+    return {"message": "Inventory item removed"}
 
 # POST: Add a new inventory item to a room
-@app.post("/rooms/{room_id}/inventory")
+@app.post("/rooms/{room_id}/inventory", dependencies=[Depends(require_user)])
 async def add_inventory_item(room_id: str, item: Item):
-    room = await rooms_collection.find_one({"id": room_id})
-    if not room:
+    try:
+        await inventory_store.add_item(room_id, item.dict())
+    except RoomNotFound:
         raise HTTPException(status_code=404, detail="Room not found")
-    for existing_item in room.get("inventory", []):
-        if existing_item["id"] == item.id:
-            raise HTTPException(status_code=400, detail="Item with this ID already exists in inventory")
-    await rooms_collection.update_one({"id": room_id}, {"$push": {"inventory": item.dict()}})
+    except DuplicateItem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await invalidate_room(room_id)
     return {"message": "Inventory item added"}
 
+# Bulk imports are validated and written in chunks of this many items
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+async def iter_ndjson_lines(request: Request):
+    # Split a (possibly chunked) NDJSON body into lines as it streams in
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def iter_values(values):
+    for value in values:
+        yield value
+
+async def parse_bulk_items(raw_items):
+    # Yields (index, item dict or None, validation error or None)
+    index = 0
+    async for raw in raw_items:
+        try:
+            if isinstance(raw, bytes):
+                item = Item.model_validate_json(raw)
+            else:
+                item = Item.model_validate(raw)
+        except ValidationError as e:
+            yield index, None, "; ".join(error["msg"] for error in e.errors())
+        else:
+            yield index, item.dict(), None
+        index += 1
+
+async def write_bulk_chunk(room_id, chunk, ordered):
+    try:
+        results = await inventory_store.add_items(room_id, [item for _, item in chunk], ordered)
+    except RoomNotFound:
+        results = [{"status": "error", "error": "Room not found"}] * len(chunk)
+    return [{"index": index, "id": item["id"], **result} for (index, item), result in zip(chunk, results)]
+
+async def bulk_add_items(room_id, records, ordered):
+    # Ordered imports stop at the first invalid or rejected item and report
+    # the rest as skipped; unordered imports attempt every item
+    try:
+        return await write_bulk_items(room_id, records, ordered)
+    finally:
+        await invalidate_room(room_id)
+
+async def write_bulk_items(room_id, records, ordered):
+    results = []
+    chunk = []
+    stopped = False
+    async for index, item, error in records:
+        if stopped:
+            results.append({"index": index, "id": item and item["id"], **SKIPPED})
+            continue
+        if error is None:
+            chunk.append((index, item))
+            if len(chunk) < BULK_CHUNK_SIZE:
+                continue
+        if chunk and (error is None or ordered):
+            written = await write_bulk_chunk(room_id, chunk, ordered)
+            results.extend(written)
+            stopped = ordered and any(result["status"] != "added" for result in written)
+            chunk = []
+        if error is not None:
+            results.append({"index": index, "id": None, **(SKIPPED if stopped else {"status": "invalid", "error": error})})
+            stopped = ordered
+    if chunk and not stopped:
+        results.extend(await write_bulk_chunk(room_id, chunk, ordered))
+    elif chunk:
+        results.extend({"index": index, "id": item["id"], **SKIPPED} for index, item in chunk)
+    return sorted(results, key=lambda result: result["index"])
+
+# POST: Add many inventory items to a room. Accepts a JSON array of items,
+# or NDJSON (one item per line, may be sent chunked) for very large imports,
+# which is written chunk by chunk as it arrives and answered with NDJSON.
+@app.post("/rooms/{room_id}/inventory/bulk", dependencies=[Depends(require_user)])
+async def add_inventory_items(room_id: str, request: Request, ordered: bool = True):
+    if not await rooms_collection.find_one({"id": room_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        results = await bulk_add_items(room_id, parse_bulk_items(iter_ndjson_lines(request)), ordered)
+        return StreamingResponse(
+            (json.dumps(result) + "\n" for result in results),
+            media_type="application/x-ndjson"
+        )
+
+    try:
+        body = json.loads(await request.body())
+    except ValueError:
+        body = None
+    if not isinstance(body, list):
+        raise HTTPException(status_code=422, detail="Expected a JSON array of items")
+    results = await bulk_add_items(room_id, parse_bulk_items(iter_values(body)), ordered)
+    added = sum(result["status"] == "added" for result in results)
+    return {"added": added, "failed": len(results) - added, "results": results}
+
 # POST: Add a missed item to a room
-@app.post("/rooms/{room_id}/missed")
+@app.post("/rooms/{room_id}/missed", dependencies=[Depends(require_user)])
 async def add_missed_item(room_id: str, item: Item):
-    update_result = await rooms_collection.update_one(
-        {"id": room_id},
-        {"$push": {"missedItems": item.dict()}}
-    )
-    if update_result.matched_count == 0:
+    if not await inventory_store.add_missed(room_id, item.dict()):
         return {"error": "Room not found"}
+    await invalidate_room(room_id)
     return {"message": "Missed item added"}
 
 # DELETE: Clear all missed items in a room
-@app.delete("/rooms/{room_id}/missed")
+@app.delete("/rooms/{room_id}/missed", dependencies=[Depends(require_user)])
 async def clear_missed_items(room_id: str):
-    update_result = await rooms_collection.update_one(
-        {"id": room_id},
-        {"$set": {"missedItems": []}}
-    )
-    if update_result.matched_count == 0:
+    if not await inventory_store.clear_missed(room_id):
         return {"error": "Room not found"}
+    await invalidate_room(room_id)
     return {"message": "Missed items cleared"}
 
+# DELETE: Mark a missed item as found (removes just that item)
+@app.delete("/rooms/{room_id}/missed/{item_id}", dependencies=[Depends(require_user)])
+async def mark_missed_item_found(room_id: str, item_id: str):
+    try:
+        await inventory_store.remove_missed(room_id, item_id)
+    except RoomNotFound:
+        raise HTTPException(status_code=404, detail="Room not found")
+    except ItemNotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+    await invalidate_room(room_id)
+    return {"message": "Missed item marked as found"}
+
 @app.post("/login")
 async def login(request: LoginRequest):
     # Find user by username
-    user = await users_collection.find_one({"username": request.username})
+    user = await users_collection.find_one({"username": request.username}, {"password": 1})
 
     if not user:
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
-    # Check password match
-    if user["password"] != request.password:
+    # Check password against the stored hash (in the hashing pool)
+    matches, needs_rehash = await password_hasher.verify(request.password, user["password"])
+    if not matches:
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
-    return {"message": "Login successful"}
+    # Upgrade plaintext or outdated hashes now that the password is known;
+    # matching on the old value keeps a concurrent password change intact
+    if needs_rehash:
+        await users_collection.update_one(
+            {"_id": user["_id"], "password": user["password"]},
+            {"$set": {"password": await password_hasher.hash(request.password)}}
+        )
+
+    return {
+        "message": "Login successful",
+        "token": token_signer.issue(request.username),
+        "token_type": "bearer",
+        "expires_in": token_signer.ttl,
+    }
 
 @app.get("/inventory/check-barcode/{barcode}")
 async def check_barcode_uniqueness(barcode: str):
-    room = await rooms_collection.find_one(
-        {"inventory.qrCode": barcode},
-        {"_id": 0, "id": 1, "name": 1}
-    )
+    room = await inventory_store.find_room_by_barcode(barcode)
     if room:
         return {"exists": True, "room": room}
     return {"exists": False}
 
-@app.get("/inventory/check-room-id/{room_id}")
-async def check_room_id_uniqueness(room_id: str):
-    room = await rooms_collection.find_one(
-        {"id": room_id},
-        {"_id": 0, "id": 1, "name": 1}
-    )
-    if room:
-        return {"exists": True, "room": room}
-    return {"exists": False}
+# POST: Check many barcodes at once with batched $in queries
+@app.post("/inventory/check-barcodes")
+async def check_barcodes(batch: BarcodeBatch):
+    found = {}
+    for start in range(0, len(batch.barcodes), BULK_CHUNK_SIZE):
+        found.update(await inventory_store.find_rooms_by_barcodes(batch.barcodes[start:start + BULK_CHUNK_SIZE]))
+    return {
+        "results": [
+            {"barcode": barcode, "exists": True, "room": found[barcode]} if barcode in found
+            else {"barcode": barcode, "exists": False}
+            for barcode in batch.barcodes
+        ]
+    }
 
-@app.post("/users/add")
+@app.get("/inventory/check-room-id/{room_id}")
+async def check_room_id_uniqueness(room_id: str, request: Request):
+    async def load():
+        room = await rooms_collection.find_one(
+            {"id": room_id},
+            {"_id": 0, "id": 1, "name": 1}
+        )
+        if room:
+            return {"exists": True, "room": room}
+        return {"exists": False}
+
+    return await cached_response(request, "room-id", room_id, load)
+
+@app.post("/users/add", dependencies=[Depends(require_user)])
 async def add_user(user: User):
-    # Check if user already exists (by email, for example)
-    existing_user = await users_collection.find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="User with this email already exists.")
-
-    # Insert new user
-    user_dict = user.dict()
-    users_collection.insert_one(user_dict)
+    if len(user.password.encode()) > MAX_PASSWORD_BYTES:
+        raise HTTPException(status_code=400, detail=f"Password must be at most {MAX_PASSWORD_BYTES} bytes.")
+
+    # Unique indexes on email and username reject duplicates atomically
+    user_dict = user.dict(exclude={"password"})
+    try:
+        await users_collection.insert_one({**user_dict, "password": await password_hasher.hash(user.password)})
+    except DuplicateKeyError as e:
+        field = "username" if "username" in ((e.details or {}).get("keyPattern") or {}) else "email"
+        raise HTTPException(status_code=400, detail=f"User with this {field} already exists.")
 
     return {"message": "User added successfully", "user": user_dict}
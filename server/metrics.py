@@ -0,0 +1,156 @@
+import threading
+
+# Metrics registry rendered in the Prometheus text exposition format
+_registry = []
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    # Shared label handling: a metric declared with labelnames keeps one
+    # series per label-value combination, selected with .labels(...).
+    kind = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        return _BoundMetric(self, key)
+
+    def _label_pairs(self, key):
+        return list(zip(self.labelnames, key))
+
+    def _copy(self, state):
+        return state
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, self._copy(state)) for key, state in self._series.items())
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, state in series:
+            lines.extend(self._render_series(self._label_pairs(key), state))
+        return lines
+
+
+class _BoundMetric:
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        self._metric.inc(amount, _key=self._key)
+
+    def dec(self, amount=1):
+        self._metric.dec(amount, _key=self._key)
+
+    def set(self, value):
+        self._metric.set(value, _key=self._key)
+
+    def observe(self, value):
+        self._metric.observe(value, _key=self._key)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, description, labelnames=()):
+        super().__init__(name, description, labelnames)
+        if not self.labelnames:
+            self._series[()] = 0
+
+    def inc(self, amount=1, _key=()):
+        with self._lock:
+            self._series[_key] = self._series.get(_key, 0) + amount
+
+    def _render_series(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, description, labelnames=()):
+        super().__init__(name, description, labelnames)
+        if not self.labelnames:
+            self._series[()] = 0
+
+    def inc(self, amount=1, _key=()):
+        with self._lock:
+            self._series[_key] = self._series.get(_key, 0) + amount
+
+    def dec(self, amount=1, _key=()):
+        self.inc(-amount, _key=_key)
+
+    def set(self, value, _key=()):
+        with self._lock:
+            self._series[_key] = value
+
+    def _render_series(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets, labelnames=()):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not self.labelnames:
+            self._series[()] = self._empty()
+
+    def _empty(self):
+        return {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+
+    def _copy(self, state):
+        return {"counts": list(state["counts"]), "sum": state["sum"]}
+
+    def observe(self, value, _key=()):
+        with self._lock:
+            state = self._series.get(_key)
+            if state is None:
+                state = self._series[_key] = self._empty()
+            state["sum"] += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            else:
+                state["counts"][-1] += 1
+
+    def _render_series(self, labels, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state["counts"]):
+            cumulative += count
+            bucket_labels = _format_labels(labels + [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
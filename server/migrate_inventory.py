@@ -0,0 +1,91 @@
+"""Move embedded room inventories into the indexed items collections.
+
+Copies every room's inventory array into "items" and its missedItems array
+into "missed_items" (one document per item, keyed by roomId), then removes
+the arrays from the room document. Run this before switching the server to
+INVENTORY_STORAGE=collection:
+
+    python migrate_inventory.py --dry-run
+    python migrate_inventory.py
+    python migrate_inventory.py --keep-arrays   # copy only, leave rooms as they are
+
+Re-running is safe: items are upserted by (roomId, id) and a room's missed
+items are rewritten as a whole, so a partially migrated room is simply
+migrated again.
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from inventory_store import ITEM_INDEXES, MISSED_ITEM_INDEXES
+
+
+def migrate_room(db, room, keep_arrays, dry_run):
+    room_id = room["id"]
+    inventory = room.get("inventory") or []
+    missed = room.get("missedItems") or []
+    if dry_run:
+        return len(inventory), len(missed), []
+
+    errors = []
+    if inventory:
+        operations = [
+            UpdateOne(
+                {"roomId": room_id, "id": item["id"]},
+                {"$setOnInsert": {k: v for k, v in item.items() if k != "id"}},
+                upsert=True,
+            )
+            for item in inventory
+        ]
+        try:
+            db["items"].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = [
+                f"item {inventory[error['index']]['id']}: {error['errmsg']}"
+                for error in e.details["writeErrors"]
+            ]
+
+    db["missed_items"].delete_many({"roomId": room_id})
+    if missed:
+        db["missed_items"].insert_many([{**item, "roomId": room_id} for item in missed])
+
+    # Only drop the arrays once every item made it across
+    if not keep_arrays and not errors:
+        db["rooms"].update_one({"_id": room["_id"]}, {"$unset": {"inventory": "", "missedItems": ""}})
+    return len(inventory), len(missed), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep-arrays", action="store_true", help="Leave the embedded arrays on the room documents")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be migrated")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))["inventory"]
+    if not args.dry_run:
+        db["items"].create_indexes(ITEM_INDEXES)
+        db["missed_items"].create_indexes(MISSED_ITEM_INDEXES)
+
+    rooms = db["rooms"].find(
+        {"$or": [{"inventory": {"$exists": True}}, {"missedItems": {"$exists": True}}]},
+        {"id": 1, "inventory": 1, "missedItems": 1},
+    )
+    totals = [0, 0, 0]
+    for room in rooms:
+        items, missed, errors = migrate_room(db, room, args.keep_arrays, args.dry_run)
+        totals[0] += 1
+        totals[1] += items
+        totals[2] += missed
+        for error in errors:
+            print(f"room {room['id']}: {error}")
+
+    action = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{action} {totals[0]} rooms, {totals[1]} inventory items, {totals[2]} missed items")
+
+
+if __name__ == "__main__":
+    main()
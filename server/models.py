@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 class Item(BaseModel):
     id: str
@@ -13,12 +13,48 @@ class Room(BaseModel):
     inventory: List[Item] = []
     missedItems: List[Item] = []
 
+# PATCH bodies: only the fields that are sent get updated
+class RoomPatch(BaseModel):
+    name: Optional[str] = None
+    lastCheckedTime: Optional[str] = None
+
+class ItemPatch(BaseModel):
+    name: Optional[str] = None
+    qrCode: Optional[str] = None
+
+class AuditStart(BaseModel):
+    confidence: float = Field(0.75, ge=0, le=1)
+
+class AuditFinish(BaseModel):
+    # Defaults to the server's current time
+    lastCheckedTime: Optional[str] = None
+
+class RoomListQuery(BaseModel):
+    # Keyset pagination: pass the id of the last room received as `after`
+    limit: Optional[int] = Field(None, ge=1, le=1000)
+    after: Optional[str] = None
+    # "summary" leaves out the inventory and missedItems arrays
+    view: Literal["full", "summary"] = "full"
+    format: Literal["json", "ndjson"] = "json"
+
+class BarcodeBatch(BaseModel):
+    barcodes: List[str] = Field(..., max_length=100000)
+
 class User(BaseModel):
     email: str
     username: str
     password: str
 
-class ImageInput(BaseModel):
+class DetectOptions(BaseModel):
+    classes: Optional[List[str]] = None
+    confidence: float = Field(0.75, ge=0, le=1)
+    max_detections: int = Field(300, ge=1)
+    # "found" returns only {"found": bool}
+    mode: Literal["full", "found"] = "full"
+    # Scopes the near-duplicate frame cache to one camera/session
+    session_id: Optional[str] = None
+
+class ImageInput(DetectOptions):
     image_base64: str
 
 class LoginRequest(BaseModel):
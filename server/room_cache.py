@@ -0,0 +1,172 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+room_cache_hits_counter = Counter(
+    "room_cache_hits_total",
+    "Room and inventory reads answered from the cache",
+    labelnames=("kind",),
+)
+room_cache_misses_counter = Counter(
+    "room_cache_misses_total",
+    "Room and inventory reads that went to MongoDB",
+    labelnames=("kind",),
+)
+
+# Cached reads per room; a write to the room invalidates all of them
+ROOM_KEY_KINDS = ("room", "inventory", "room-id")
+
+
+class MemoryCacheBackend:
+    # In-process LRU with a per-entry TTL. Runs on the event loop only,
+    # so it needs no lock.
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._entries.pop(key, None)
+
+
+class RedisCacheBackend:
+    # Shared cache for several server processes; needs the optional
+    # `redis` package and any Redis-compatible server. Room generations
+    # live in Redis too, so an invalidation on one process also fences
+    # fills started on the others.
+    shared = True
+
+    def __init__(self, url):
+        import redis.asyncio
+
+        self._client = redis.asyncio.from_url(url)
+
+    async def get(self, key):
+        return await self._client.get(key)
+
+    async def set(self, key, value, ttl):
+        await self._client.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, *keys):
+        await self._client.delete(*keys)
+
+    async def generation(self, room_id):
+        return int(await self._client.get(f"generation:{room_id}") or 0)
+
+    async def bump(self, room_id, ttl):
+        # The counter outlives every entry written under the previous
+        # generation (loads are assumed to finish within the grace period),
+        # so expiring it can never bring a stale entry back
+        key = f"generation:{room_id}"
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, int(ttl) + GENERATION_GRACE)
+            await pipe.execute()
+
+
+# Seconds a shared generation counter outlives the entries it fences
+GENERATION_GRACE = 3600
+
+
+def create_cache_backend(url=None, max_entries=1024):
+    if url:
+        return RedisCacheBackend(url)
+    return MemoryCacheBackend(max_entries)
+
+
+def etag_for(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+# Cached values are the ETag and the body in one bytes value, so a hit
+# neither rehashes the body nor needs a second lookup. JSON bodies never
+# contain a raw newline.
+def _pack(etag, body):
+    return etag.encode() + b"\n" + body
+
+
+def _unpack(value):
+    etag, _, body = value.partition(b"\n")
+    return body, etag.decode()
+
+
+class RoomCache:
+    # Read-through cache of serialized JSON response bodies and their
+    # ETags, keyed by (kind, room id). Invalidation bumps the room's
+    # generation, so a read that raced with a write never serves its stale
+    # result. In-process, rooms are only tracked while a load is pending, so
+    # the bookkeeping stays as small as the concurrency. A shared backend
+    # keeps the generation itself and it becomes part of every key: a stale
+    # fill from any process lands under a generation nobody reads anymore.
+
+    def __init__(self, backend, ttl=30.0):
+        self.backend = backend
+        self.ttl = ttl
+        # room id -> [loads in flight, generation]
+        self._pending = {}
+
+    async def get_or_load(self, kind, room_id, load):
+        # Returns (body, etag)
+        if self.backend.shared:
+            return await self._get_or_load_shared(kind, room_id, load)
+        key = f"{kind}:{room_id}"
+        value = await self.backend.get(key)
+        if value is not None:
+            room_cache_hits_counter.labels(kind=kind).inc()
+            return _unpack(value)
+        room_cache_misses_counter.labels(kind=kind).inc()
+        pending = self._pending.setdefault(room_id, [0, 0])
+        pending[0] += 1
+        generation = pending[1]
+        try:
+            body = await load()
+        finally:
+            pending[0] -= 1
+            if not pending[0]:
+                del self._pending[room_id]
+        etag = etag_for(body)
+        if pending[1] == generation:
+            await self.backend.set(key, _pack(etag, body), self.ttl)
+        return body, etag
+
+    async def _get_or_load_shared(self, kind, room_id, load):
+        key = f"{kind}:{room_id}:{await self.backend.generation(room_id)}"
+        value = await self.backend.get(key)
+        if value is not None:
+            room_cache_hits_counter.labels(kind=kind).inc()
+            return _unpack(value)
+        room_cache_misses_counter.labels(kind=kind).inc()
+        body = await load()
+        etag = etag_for(body)
+        await self.backend.set(key, _pack(etag, body), self.ttl)
+        return body, etag
+
+    async def invalidate(self, room_id):
+        if self.backend.shared:
+            # Entries of older generations are never read again and expire
+            await self.backend.bump(room_id, self.ttl)
+            return
+        if room_id in self._pending:
+            self._pending[room_id][1] += 1
+        await self.backend.delete(*(f"{kind}:{room_id}" for kind in ROOM_KEY_KINDS))
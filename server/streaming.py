@@ -0,0 +1,39 @@
+import asyncio
+
+from metrics import Counter
+
+dropped_frames_counter = Counter(
+    "detect_stream_dropped_frames_total",
+    "Streamed frames replaced by a newer frame before inference picked them up",
+)
+
+
+class FrameSlot:
+    # Single-slot mailbox for streamed frames: a new frame replaces any frame
+    # that has not been picked up yet, so a slow consumer always works on the
+    # freshest frame and latency stays bounded instead of queueing.
+
+    def __init__(self):
+        self._frame = None
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, frame):
+        if self._frame is not None:
+            self.dropped += 1
+            dropped_frames_counter.inc()
+        self._frame = frame
+        self._ready.set()
+
+    async def get(self):
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+def contains_item(detections, item_name):
+    if not item_name:
+        return False
+    item_name = item_name.lower()
+    return any(d["label"].lower() == item_name for d in detections)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the server modules the way the app does, from server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def api(monkeypatch):
+    # The app in-process against mongomock, without loading the detector
+    import httpx
+    from mongomock_motor import AsyncMongoMockClient
+
+    import main
+
+    connect_mongo = main.connect_mongo
+    mock = AsyncMongoMockClient()
+    monkeypatch.setattr(main, "connect_mongo", lambda: connect_mongo(mock))
+
+    async def skip_detector():
+        main.detector_status.update(state="skipped")
+
+    monkeypatch.setattr(main, "load_detector", skip_detector)
+    monkeypatch.setattr(main, "DETECT_BACKGROUND_LOAD", True)
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
@@ -0,0 +1,35 @@
+import pytest
+
+import main
+from auth import TokenSigner
+
+
+@pytest.fixture
+def signer():
+    return TokenSigner("secret", ttl=60)
+
+
+def test_issued_token_verifies(signer):
+    assert signer.verify(signer.issue("sam"))["sub"] == "sam"
+
+
+@pytest.mark.parametrize("token", ["", "garbage", "abc.déf", "ünïcode.sïgnature"])
+def test_bad_tokens_are_rejected(signer, token):
+    assert signer.verify(token) is None
+
+
+def test_tampered_and_foreign_tokens_are_rejected(signer):
+    payload, _, signature = signer.issue("sam").partition(".")
+    assert signer.verify(f"{payload}x.{signature}") is None
+    assert signer.verify(TokenSigner("other").issue("sam")) is None
+
+
+@pytest.mark.anyio
+async def test_non_ascii_bearer_token_is_a_401(api, monkeypatch):
+    monkeypatch.setattr(main, "AUTH_REQUIRED", True)
+    response = await api.post(
+        "/rooms",
+        json={"id": "a", "name": "Lab", "lastCheckedTime": ""},
+        headers={"Authorization": "Bearer abc.déf".encode("latin-1")},
+    )
+    assert response.status_code == 401
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+def item(item_id):
+    return {"id": item_id, "name": "Chair", "qrCode": f"qr-{item_id}"}
+
+
+def statuses(results):
+    return [(result["index"], result["status"]) for result in results]
+
+
+@pytest.fixture
+async def room(api):
+    await api.post("/rooms", json={"id": "a", "name": "Lab", "lastCheckedTime": ""})
+    await api.post("/rooms/a/inventory", json=item("1"))
+    return api
+
+
+async def inventory_ids(api):
+    return [i["id"] for i in (await api.get("/rooms/a/inventory")).json()]
+
+
+async def test_ordered_json_stops_at_first_failure(room):
+    response = await room.post("/rooms/a/inventory/bulk", json=[item("2"), item("1"), item("3")])
+
+    body = response.json()
+    assert (body["added"], body["failed"]) == (1, 2)
+    assert statuses(body["results"]) == [(0, "added"), (1, "duplicate"), (2, "skipped")]
+    assert await inventory_ids(room) == ["1", "2"]
+
+
+async def test_unordered_json_attempts_every_item(room):
+    items = [item("2"), {"id": "bad"}, item("1"), item("3")]
+    response = await room.post("/rooms/a/inventory/bulk?ordered=false", json=items)
+
+    body = response.json()
+    assert statuses(body["results"]) == [(0, "added"), (1, "invalid"), (2, "duplicate"), (3, "added")]
+    assert await inventory_ids(room) == ["1", "2", "3"]
+
+
+async def test_ordered_json_stops_at_invalid_item(room):
+    response = await room.post("/rooms/a/inventory/bulk", json=[item("2"), {"id": "bad"}, item("3")])
+
+    assert statuses(response.json()["results"]) == [(0, "added"), (1, "invalid"), (2, "skipped")]
+    assert await inventory_ids(room) == ["1", "2"]
+
+
+async def test_json_body_must_be_an_array(room):
+    response = await room.post("/rooms/a/inventory/bulk", json=item("2"))
+    assert response.status_code == 422
+
+
+async def test_ndjson_streams_one_result_per_line(room, monkeypatch):
+    # Small chunks, so results span several writes
+    monkeypatch.setattr(main, "BULK_CHUNK_SIZE", 2)
+    lines = [json.dumps(item(str(n))) for n in range(2, 7)]
+    body = ("\n".join(lines[:3]) + "\n\n" + "\n".join(lines[3:])).encode()
+
+    async def chunks():
+        # Chunk boundaries fall mid-line
+        for start in range(0, len(body), 7):
+            yield body[start:start + 7]
+
+    response = await room.post(
+        "/rooms/a/inventory/bulk?ordered=false",
+        content=chunks(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert statuses(results) == [(n, "added") for n in range(5)]
+    assert await inventory_ids(room) == ["1", "2", "3", "4", "5", "6"]
+
+
+async def test_ndjson_ordered_skips_after_invalid_line(room):
+    body = "\n".join([json.dumps(item("2")), "{not json", json.dumps(item("3"))])
+    response = await room.post(
+        "/rooms/a/inventory/bulk", content=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert statuses(results) == [(0, "added"), (1, "invalid"), (2, "skipped")]
+    assert await inventory_ids(room) == ["1", "2"]
+
+
+async def test_bulk_into_missing_room(api):
+    response = await api.post("/rooms/missing/inventory/bulk", json=[item("1")])
+    assert response.status_code == 404
@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import parse_stream_config
+
+
+@pytest.mark.parametrize("config, error", [
+    ([], "Config must be a JSON object"),
+    ("chair", "Config must be a JSON object"),
+    (1, "Config must be a JSON object"),
+    ({"confidence": "high"}, "confidence must be a number between 0 and 1"),
+    ({"confidence": 1.5}, "confidence must be a number between 0 and 1"),
+    ({"confidence": True}, "confidence must be a number between 0 and 1"),
+    ({"itemName": 3}, "itemName must be a string"),
+])
+def test_invalid_configs_are_rejected(config, error):
+    assert parse_stream_config(config) == (None, error)
+
+
+def test_valid_config_updates_only_known_keys():
+    assert parse_stream_config({"itemName": "desk", "confidence": 1, "other": 2}) == (
+        {"itemName": "desk", "confidence": 1.0}, None,
+    )
+    assert parse_stream_config({"itemName": None}) == ({"itemName": None}, None)
+
+
+def test_bad_config_keeps_the_socket_open(monkeypatch):
+    # Config messages never reach the batcher; it only has to exist
+    monkeypatch.setattr(main, "batcher", object())
+    with TestClient(main.app).websocket_connect("/ws/detect") as websocket:
+        for message in ("[]", '"x"', "1", '{"confidence": "high"}', "not json"):
+            websocket.send_text(message)
+            assert "error" in websocket.receive_json()
+        websocket.send_text('{"confidence": 0.5}')
+        websocket.send_text("[]")
+        assert websocket.receive_json() == {"error": "Config must be a JSON object"}
@@ -0,0 +1,34 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import DuplicateKeyError
+
+from indexes import UniqueIndexError, ensure_indexes
+from inventory_store import create_inventory_store
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["test"]
+
+
+async def test_ensure_indexes_builds_unique_indexes(db):
+    await ensure_indexes(db, create_inventory_store(db))
+
+    assert (await db["users"].index_information())["username"]["unique"]
+    await db["rooms"].insert_one({"id": "a"})
+    with pytest.raises(DuplicateKeyError):
+        await db["rooms"].insert_one({"id": "a"})
+
+
+async def test_ensure_indexes_fails_when_data_has_duplicates(db):
+    await db["users"].insert_many([
+        {"username": "sam", "email": "one@example.com"},
+        {"username": "sam", "email": "two@example.com"},
+    ])
+
+    with pytest.raises(UniqueIndexError, match="users.username"):
+        await ensure_indexes(db, create_inventory_store(db))
+    # The other indexes are still built
+    assert "email" in await db["users"].index_information()
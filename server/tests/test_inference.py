@@ -0,0 +1,228 @@
+import asyncio
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+import inference
+from inference import DEFAULT_MAX_DETECTIONS, ExecutorBackend, artifact_max_batch, decode_image, export_model, InferenceBatcher, InferenceOverloaded, _merge_options, _run_model, detection_options
+
+
+class FakeBackend:
+    # Echoes each frame back and records the batches it was given
+    workers = 1
+    max_batch = None
+
+    def __init__(self):
+        self.batches = []
+
+    async def infer(self, frames, scales, options):
+        self.batches.append(list(frames))
+        await asyncio.sleep(0)
+        return [[{"frame": frame}] for frame in frames], {}
+
+    def shutdown(self):
+        pass
+
+
+@pytest.mark.anyio
+async def test_concurrent_frames_share_one_batch():
+    backend = FakeBackend()
+    batcher = InferenceBatcher(backend, max_batch_size=8, max_wait=0.05)
+    batcher.start()
+    try:
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+    finally:
+        await batcher.stop()
+
+    assert backend.batches == [[0, 1, 2, 3, 4]]
+    assert results == [[{"frame": i}] for i in range(5)]
+
+
+@pytest.mark.anyio
+async def test_batches_are_capped_at_max_batch_size():
+    backend = FakeBackend()
+    batcher = InferenceBatcher(backend, max_batch_size=2, max_wait=0.05)
+    batcher.start()
+    try:
+        await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+    finally:
+        await batcher.stop()
+
+    assert [len(batch) for batch in backend.batches] == [2, 2, 1]
+
+
+@pytest.mark.parametrize("weights, max_batch", [
+    ("best.pt", None),
+    ("best-640-fp32.onnx", None),
+    ("best-640-int8_openvino_model", None),
+    ("best-640-int8_openvino_model/", None),
+    ("best-640-fp32.torchscript", 1),
+])
+def test_artifact_max_batch(weights, max_batch):
+    assert artifact_max_batch(weights) == max_batch
+
+
+@pytest.mark.anyio
+async def test_fixed_batch_artifacts_run_one_frame_at_a_time():
+    backend = FakeBackend()
+    backend.max_batch = 1
+    batcher = InferenceBatcher(backend, max_batch_size=8, max_wait=0.05)
+    batcher.start()
+    try:
+        await asyncio.gather(*(batcher.submit(i) for i in range(3)))
+    finally:
+        await batcher.stop()
+
+    assert backend.batches == [[0], [1], [2]]
+
+
+@pytest.mark.anyio
+async def test_full_queue_rejects_frames():
+    batcher = InferenceBatcher(FakeBackend(), max_queue=1)
+    batcher.start()
+    try:
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0)
+        # The batcher holds frame 0; frame 1 fills the queue
+        second = asyncio.ensure_future(batcher.submit(1))
+        with pytest.raises(InferenceOverloaded):
+            await batcher.submit(2)
+        await asyncio.gather(first, second)
+    finally:
+        await batcher.stop()
+
+
+@pytest.mark.anyio
+async def test_full_decode_queue_rejects_payloads():
+    backend = ExecutorBackend(ThreadPoolExecutor(max_workers=1), workers=1, decode_workers=1, max_decode_queue=2)
+    release = threading.Event()
+    try:
+        decoding = [asyncio.ensure_future(backend.decode(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(InferenceOverloaded):
+            await backend.decode(release.wait)
+        release.set()
+        await asyncio.gather(*decoding)
+        # Slots free up once decodes finish
+        assert await backend.decode(len, b"abc") == 3
+    finally:
+        release.set()
+        backend.shutdown()
+
+
+def test_merge_options_reduces_limit_only_for_identical_filters():
+    same = [detection_options(["desk"], 0.5, 1), detection_options(["desk"], 0.5, 3)]
+    assert _merge_options([[2], [2]], same) == ([2], 0.5, 3)
+
+    mixed = [detection_options(["desk"], 0.75, 1), detection_options(["chair"], 0.75, 1)]
+    assert _merge_options([[2], [0]], mixed) == ([0, 2], 0.75, DEFAULT_MAX_DETECTIONS)
+
+    confidences = [detection_options(None, 0.9, 1), detection_options(None, 0.3, 1)]
+    assert _merge_options([None, None], confidences) == (None, 0.3, DEFAULT_MAX_DETECTIONS)
+
+
+class FakeBoxes:
+    def __init__(self, data):
+        self.data = torch.from_numpy(data)
+
+
+class FakeResult:
+    def __init__(self, data, names):
+        self.boxes = FakeBoxes(data)
+        self.names = names
+        self.speed = {"inference": 1.0, "postprocess": 1.0}
+
+
+class FakeModel:
+    # Every frame holds a chair (0.9), a laptop (0.8) and a desk (0.5), and
+    # the model filters like ultralytics: classes, conf, then max_det
+    names = {0: "chair", 1: "Laptop", 2: "desk"}
+
+    def __call__(self, inputs, classes=None, conf=0.25, max_det=300, verbose=True):
+        rows = np.array([
+            [10, 10, 20, 20, 0.9, 0],
+            [30, 30, 40, 40, 0.8, 1],
+            [50, 50, 60, 60, 0.5, 2],
+        ], dtype=np.float32)
+        rows = rows[rows[:, 4] >= conf]
+        if classes is not None:
+            rows = rows[np.isin(rows[:, 5], classes)]
+        return [FakeResult(rows[:max_det], self.names) for _ in range(len(inputs))]
+
+
+@pytest.fixture
+def fake_worker(monkeypatch):
+    state = inference._worker_state
+    model = FakeModel()
+    monkeypatch.setattr(state, "model", model, raising=False)
+    monkeypatch.setattr(state, "imgsz", 64, raising=False)
+    monkeypatch.setattr(state, "class_ids", {name.lower(): idx for idx, name in model.names.items()}, raising=False)
+    monkeypatch.setattr(state, "pixels", np.empty((0, 64, 64, 3), dtype=np.uint8), raising=False)
+    monkeypatch.setattr(state, "inputs", torch.empty((0, 3, 64, 64)), raising=False)
+
+
+def labels(detections):
+    return [d["label"] for d in detections]
+
+
+def test_requests_in_one_batch_keep_their_own_filters(fake_worker):
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    options = [
+        detection_options(["desk"], 0.4, 1),
+        detection_options(["chair"], 0.75, 1),
+        detection_options(None, 0.75, 300),
+    ]
+    results, _ = _run_model([frame] * 3, [1.0] * 3, options)
+
+    assert [labels(r) for r in results] == [["desk"], ["chair"], ["chair", "Laptop"]]
+
+
+def test_unknown_classes_return_no_detections(fake_worker):
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    results, _ = _run_model([frame], [1.0], [detection_options(["sofa"])])
+    assert results == [[]]
+
+
+def jpeg(width, height, orientation=None):
+    data = cv2.imencode(".jpg", np.full((height, width, 3), 128, dtype=np.uint8))[1].tobytes()
+    if orientation is None:
+        return data
+    # APP1 Exif segment holding a single little-endian Orientation tag
+    tiff = b"II*\x00\x08\x00\x00\x00" + b"\x01\x00" + struct.pack("<HHIHH", 0x0112, 3, 1, orientation, 0) + b"\x00" * 4
+    payload = b"Exif\x00\x00" + tiff
+    return data[:2] + b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload + data[2:]
+
+
+def test_decode_image_reduces_large_jpegs():
+    frame, scale = decode_image(jpeg(1280, 640), target_size=320)
+    assert frame.shape[:2] == (160, 320)
+    assert scale == 4.0
+
+
+def test_decode_image_keeps_small_images_full_size():
+    frame, scale = decode_image(jpeg(400, 300), target_size=320)
+    assert frame.shape[:2] == (300, 400)
+    assert scale == 1.0
+
+
+def test_decode_image_scale_ignores_exif_rotation():
+    # Orientation 6 rotates the decoded frame to portrait
+    frame, scale = decode_image(jpeg(1280, 640, orientation=6), target_size=320)
+    assert frame.shape[:2] == (320, 160)
+    assert scale == 4.0
+
+
+def test_export_names_artifacts_after_their_real_precision(tmp_path):
+    weights = tmp_path / "best.pt"
+    for name in ("best-320-fp32.onnx", "best-320-int8_openvino_model"):
+        (tmp_path / name).touch()
+
+    # ONNX exports on the CPU are FP32 whatever half/int8 ask for
+    assert export_model(str(weights), "onnx", 320, half=True) == str(tmp_path / "best-320-fp32.onnx")
+    assert export_model(str(weights), "onnx", 320, int8=True) == str(tmp_path / "best-320-fp32.onnx")
+    assert export_model(str(weights), "openvino", 320, int8=True) == str(tmp_path / "best-320-int8_openvino_model")
@@ -0,0 +1,17 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import Int64
+
+from instrumentation import MongoCommandTimer
+
+
+@pytest.mark.parametrize("command_name, command, collection", [
+    ("find", {"find": "rooms", "filter": {}}, "rooms"),
+    ("getMore", {"getMore": Int64(8731), "collection": "items"}, "items"),
+    ("ping", {"ping": 1}, "-"),
+])
+def test_commands_are_labelled_by_collection(command_name, command, collection):
+    timer = MongoCommandTimer()
+    timer.started(SimpleNamespace(command_name=command_name, command=command, connection_id=("db", 27017), request_id=1))
+    assert timer._pending == {(("db", 27017), 1): collection}
@@ -0,0 +1,119 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from indexes import ensure_indexes
+from inventory_store import DuplicateItem, create_inventory_store
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def store():
+    db = AsyncMongoMockClient()["test"]
+    store = create_inventory_store(db, "collection")
+    await ensure_indexes(db, store)
+    return store
+
+
+def room(room_id, items, missed=()):
+    return {"id": room_id, "name": room_id, "lastCheckedTime": "", "inventory": list(items), "missedItems": list(missed)}
+
+
+def item(item_id, qr_code):
+    return {"id": item_id, "name": "Chair", "qrCode": qr_code}
+
+
+async def stored(store, room_id):
+    found = await store.rooms.find_one({"id": room_id}, {"_id": 0})
+    return found and await store.attach(found)
+
+
+async def test_replace_room_swaps_items(store):
+    await store.insert_room(room("a", [item("1", "qr-1"), item("2", "qr-2")], [item("2", "qr-2")]))
+
+    # Reusing the room's own codes is not a conflict
+    assert await store.replace_room("a", room("a", [item("2", "qr-2"), item("3", "qr-3")]))
+
+    replaced = await stored(store, "a")
+    assert [i["id"] for i in replaced["inventory"]] == ["2", "3"]
+    assert replaced["missedItems"] == []
+
+
+async def test_replace_room_with_taken_qr_code_keeps_old_room(store):
+    await store.insert_room(room("a", [item("1", "qr-1")], [item("1", "qr-1")]))
+    await store.insert_room(room("b", [item("9", "qr-9")]))
+    before = await stored(store, "a")
+
+    with pytest.raises(DuplicateItem):
+        await store.replace_room("a", {**room("a", [item("2", "qr-9")]), "name": "Renamed"})
+
+    assert await stored(store, "a") == before
+    assert (await stored(store, "b"))["inventory"] == [item("9", "qr-9")]
+
+
+async def test_replace_room_with_repeated_ids_keeps_old_room(store):
+    await store.insert_room(room("a", [item("1", "qr-1")]))
+    before = await stored(store, "a")
+
+    with pytest.raises(DuplicateItem):
+        await store.replace_room("a", room("a", [item("2", "qr-2"), item("2", "qr-3")]))
+
+    assert await stored(store, "a") == before
+
+
+async def test_replace_room_restores_old_items_when_insert_loses_race(store, monkeypatch):
+    # A code taken between the check and the insert: the old room comes back
+    await store.insert_room(room("a", [item("1", "qr-1")], [item("1", "qr-1")]))
+    before = await stored(store, "a")
+
+    async def no_check(room_id, inventory):
+        await store.items.insert_one({**item("9", "qr-2"), "roomId": "b"})
+
+    monkeypatch.setattr(store, "_check_replacement", no_check)
+    with pytest.raises(DuplicateItem):
+        await store.replace_room("a", room("a", [item("2", "qr-2")]))
+
+    assert await stored(store, "a") == before
+
+
+async def test_insert_room_with_duplicate_leaves_nothing_behind(store):
+    await store.insert_room(room("b", [item("9", "qr-9")]))
+
+    with pytest.raises(DuplicateItem):
+        await store.insert_room(room("a", [item("1", "qr-1"), item("2", "qr-9")]))
+
+    assert await stored(store, "a") is None
+    assert await store.items.count_documents({"roomId": "a"}) == 0
+
+
+async def test_replace_missing_room(store):
+    assert not await store.replace_room("missing", room("missing", []))
+
+
+async def test_replace_room_can_rename(store):
+    await store.insert_room(room("a", [item("1", "qr-1")], [item("1", "qr-1")]))
+
+    assert await store.replace_room("a", room("b", [item("1", "qr-1"), item("2", "qr-2")], [item("1", "qr-1")]))
+
+    assert await stored(store, "a") is None
+    renamed = await stored(store, "b")
+    assert [i["id"] for i in renamed["inventory"]] == ["1", "2"]
+    assert [i["id"] for i in renamed["missedItems"]] == ["1"]
+    assert await store.items.count_documents({"roomId": "a"}) == 0
+    assert await store.missed.count_documents({"roomId": "a"}) == 0
+
+
+async def test_failed_rename_keeps_old_room(store, monkeypatch):
+    await store.insert_room(room("a", [item("1", "qr-1")], [item("1", "qr-1")]))
+    before = await stored(store, "a")
+
+    async def no_check(room_id, inventory):
+        await store.items.insert_one({**item("9", "qr-2"), "roomId": "c"})
+
+    monkeypatch.setattr(store, "_check_replacement", no_check)
+    with pytest.raises(DuplicateItem):
+        await store.replace_room("a", room("b", [item("1", "qr-1"), item("2", "qr-2")]))
+
+    assert await stored(store, "a") == before
+    assert await stored(store, "b") is None
+    assert await store.items.count_documents({"roomId": "b"}) == 0
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+import main
+from room_cache import MemoryCacheBackend, RoomCache, etag_for
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def cache():
+    return RoomCache(MemoryCacheBackend(), ttl=60)
+
+
+def loader(*bodies):
+    calls = []
+
+    async def load():
+        calls.append(None)
+        return bodies[min(len(calls), len(bodies)) - 1]
+
+    return load, calls
+
+
+async def test_hits_return_the_stored_etag(cache, monkeypatch):
+    load, calls = loader(b'{"id": "a"}')
+    assert await cache.get_or_load("room", "a", load) == (b'{"id": "a"}', etag_for(b'{"id": "a"}'))
+
+    monkeypatch.setattr("room_cache.etag_for", lambda body: pytest.fail("hit rehashed the body"))
+    assert await cache.get_or_load("room", "a", load) == (b'{"id": "a"}', etag_for(b'{"id": "a"}'))
+    assert len(calls) == 1
+
+
+async def test_invalidate_drops_every_kind(cache):
+    room, _ = loader(b"1", b"2")
+    inventory, _ = loader(b"[1]", b"[2]")
+    await cache.get_or_load("room", "a", room)
+    await cache.get_or_load("inventory", "a", inventory)
+
+    await cache.invalidate("a")
+
+    assert (await cache.get_or_load("room", "a", room))[0] == b"2"
+    assert (await cache.get_or_load("inventory", "a", inventory))[0] == b"[2]"
+
+
+async def test_load_racing_a_write_is_not_stored(cache):
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_load():
+        started.set()
+        await release.wait()
+        return b"stale"
+
+    reading = asyncio.ensure_future(cache.get_or_load("room", "a", slow_load))
+    await started.wait()
+    await cache.invalidate("a")
+    release.set()
+    assert (await reading)[0] == b"stale"
+
+    fresh, _ = loader(b"fresh")
+    assert (await cache.get_or_load("room", "a", fresh))[0] == b"fresh"
+
+
+async def test_rooms_are_only_tracked_while_loading(cache):
+    for n in range(100):
+        load, _ = loader(b"{}")
+        await cache.get_or_load("room", str(n), load)
+        await cache.invalidate(str(n))
+    assert cache._pending == {}
+
+
+async def test_etag_revalidation_and_invalidation(api, monkeypatch):
+    monkeypatch.setattr(main, "room_cache", RoomCache(MemoryCacheBackend(), ttl=60))
+    await api.post("/rooms", json={"id": "a", "name": "Lab", "lastCheckedTime": ""})
+
+    first = await api.get("/rooms/a")
+    etag = first.headers["etag"]
+    not_modified = await api.get("/rooms/a", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    await api.patch("/rooms/a", json={"name": "Library"})
+    changed = await api.get("/rooms/a", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["name"] == "Library"
+    assert changed.headers["etag"] != etag
+
+
+class SharedBackend(MemoryCacheBackend):
+    # Stands in for Redis: one store and generation map behind several caches
+    shared = True
+
+    def __init__(self):
+        super().__init__()
+        self.generations = {}
+
+    async def generation(self, room_id):
+        return self.generations.get(room_id, 0)
+
+    async def bump(self, room_id, ttl):
+        self.generations[room_id] = self.generations.get(room_id, 0) + 1
+
+
+async def test_shared_backend_fences_fills_from_other_processes():
+    backend = SharedBackend()
+    reader, writer = RoomCache(backend, ttl=60), RoomCache(backend, ttl=60)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_load():
+        started.set()
+        await release.wait()
+        return b"stale"
+
+    reading = asyncio.ensure_future(reader.get_or_load("room", "a", slow_load))
+    await started.wait()
+    await writer.invalidate("a")
+    release.set()
+    await reading
+
+    fresh, _ = loader(b"fresh")
+    assert (await reader.get_or_load("room", "a", fresh))[0] == b"fresh"
+    assert (await writer.get_or_load("room", "a", fresh))[0] == b"fresh"
+
+
+async def test_rename_invalidates_the_new_id(api, monkeypatch):
+    monkeypatch.setattr(main, "room_cache", RoomCache(MemoryCacheBackend(), ttl=60))
+    await api.post("/rooms", json={"id": "a", "name": "Lab", "lastCheckedTime": ""})
+    assert (await api.get("/rooms/b")).json() == {"error": "Room not found"}
+
+    await api.put("/rooms/a", json={"id": "b", "name": "Lab", "lastCheckedTime": ""})
+
+    assert (await api.get("/rooms/b")).json()["id"] == "b"
+    assert (await api.get("/rooms/a")).json() == {"error": "Room not found"}